@@ -1,40 +1,87 @@
-import os
-from flask import jsonify, send_from_directory
+import redis
+from flask import jsonify, Response
 
 from app import app
 
 import models
+import metrics
+
+from registry import RunRegistry
+
+backend_redis = redis.StrictRedis.from_url(app.config['CELERY_RESULT_BACKEND'])
+runs = RunRegistry(backend_redis)
+
+def run_state(task, task_id):
+    result = task.AsyncResult(task_id)
+    if task is models.distributed_test and result.state == 'SUCCESS':
+        # the run goes on in the chord; follow its merge task
+        result = task.AsyncResult(result.result)
+    return result.state
+
+def start_test(run_key, file_name, task, args, message):
+    contents = runs.result(run_key, file_name)
+    if contents is not None:
+        return Response(contents, mimetype='text/plain')
+    task_id, created = runs.claim(run_key)
+    if created:
+        task.apply_async(args=args, task_id=task_id)
+    state = run_state(task, task_id)
+    if state == 'FAILURE':
+        # let the next request start it again
+        runs.release(run_key)
+        message = 'Test failed.'
+    elif not created:
+        message = 'Test already running.'
+    response = {'status': 200, 'message': message, 'task_id': task_id, 'state': state}
+    pos_response = jsonify(response)
+    return pos_response
 
 # output_filename = 'key_generation-{}-{}-{}-{}-{}'.format(num_threads, num_users, file_size, policy_size, num_attributes)
 @app.route('/test/keygen/<int:num_threads>/<int:num_users>/<int:file_size>/<int:policy_size>/<int:num_attributes>')
 def test_keygen(num_threads, num_users, file_size, policy_size, num_attributes):
-    file_name = models.keygen_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes)
-    if os.path.exists(os.path.join(models.results_dir, file_name)):
-        return send_from_directory(models.results_dir, file_name)
-    else:
-        models.key_generation_test.delay(num_threads, num_users, file_size, policy_size, num_attributes)
-        response = {'status': 200, 'message': 'Key generation test started.'}
-        pos_response = jsonify(response)
-        return pos_response        
+    params = (num_threads, num_users, file_size, policy_size, num_attributes)
+    file_name = models.keygen_file_name.format(*params)
+    return start_test(runs.run_key('keygen', *params), file_name, models.key_generation_test, params, 'Key generation test started.')
 
 @app.route('/test/save/<int:num_threads>/<int:num_users>/<int:file_size>/<int:policy_size>/<int:num_attributes>')
 def test_save(num_threads, num_users, file_size, policy_size, num_attributes):
-    file_name = models.save_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes)
-    if os.path.exists(os.path.join(models.results_dir, file_name)):
-        return send_from_directory(models.results_dir, file_name)
-    else:
-        models.save_encounter_test.delay(num_threads, num_users, file_size, policy_size, num_attributes)
-        response = {'status': 200, 'message': 'Save test started.'}
-        pos_response = jsonify(response)
-        return pos_response
+    params = (num_threads, num_users, file_size, policy_size, num_attributes)
+    file_name = models.save_file_name.format(*params)
+    return start_test(runs.run_key('save', *params), file_name, models.save_encounter_test, params, 'Save test started.')
 
 @app.route('/test/query/<int:num_threads>/<int:num_users>/<int:file_size>/<int:policy_size>/<int:num_attributes>')
 def test_query(num_threads, num_users, file_size, policy_size, num_attributes):
-    file_name = models.query_file_name.format(num_users, file_size)
-    if os.path.exists(os.path.join(models.results_dir, file_name)):
-        return send_from_directory(models.results_dir, file_name)
-    else:
-        models.query_encounter_test.delay(num_threads, num_users, file_size, policy_size, num_attributes)
-        response = {'status': 200, 'message': 'Query test started.'}
+    params = (num_threads, num_users, file_size, policy_size, num_attributes)
+    file_name = models.query_file_name.format(*params)
+    return start_test(runs.run_key('query', *params), file_name, models.query_encounter_test, params, 'Query test started.')
+
+@app.route('/test/distributed/<scenario>/<int:num_shards>/<int:num_threads>/<int:num_users>/<int:file_size>/<int:policy_size>/<int:num_attributes>')
+def test_distributed(scenario, num_shards, num_threads, num_users, file_size, policy_size, num_attributes):
+    if scenario not in models.distributed_file_names:
+        response = {'status': 404, 'message': 'Unknown test scenario {}.'.format(scenario)}
         pos_response = jsonify(response)
-        return pos_response
\ No newline at end of file
+        pos_response.status_code = 404
+        return pos_response
+    params = (scenario, num_shards, num_threads, num_users, file_size, policy_size, num_attributes)
+    file_name = models.distributed_file_names[scenario].format(*params[1:])
+    return start_test(runs.run_key('distributed', *params), file_name, models.distributed_test, params,
+                      'Distributed {} test started on {} shards.'.format(scenario, num_shards))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.prometheus_text(metrics.read_all_metrics(backend_redis)),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/test/metrics')
+def test_metrics():
+    return jsonify({'status': 200, 'runs': metrics.read_all_metrics(backend_redis)})
+
+@app.route('/test/metrics/<run_id>')
+def test_run_metrics(run_id):
+    run_metrics = metrics.read_metrics(backend_redis, run_id)
+    if run_metrics is None:
+        response = {'status': 404, 'message': 'No metrics for run {}.'.format(run_id)}
+        pos_response = jsonify(response)
+        pos_response.status_code = 404
+        return pos_response
+    return jsonify({'status': 200, 'run': run_metrics})
\ No newline at end of file
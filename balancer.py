@@ -0,0 +1,46 @@
+# Client-side load balancing over the IL replicas in il_upstream_urls.
+# 'round_robin' hands out the URLs in turn; 'least_outstanding' picks the
+# replica with the fewest requests in flight from this process, rotating
+# between ties so an idle start still spreads the load.
+import threading
+import itertools
+
+from contextlib import contextmanager
+
+from config import *
+
+class Upstreams(object):
+    def __init__(self, urls=None, policy=None):
+        self.urls = list(urls or il_upstream_urls)
+        self.policy = policy or load_balancing
+        if self.policy not in ('round_robin', 'least_outstanding'):
+            raise ValueError('unknown load balancing policy {}'.format(self.policy))
+        self.outstanding = dict.fromkeys(self.urls, 0)
+        self.sent = dict.fromkeys(self.urls, 0)
+        self.turn = itertools.count()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            start = next(self.turn) % len(self.urls)
+            if self.policy == 'least_outstanding':
+                url = min(self.urls[start:] + self.urls[:start], key=self.outstanding.get)
+            else:
+                url = self.urls[start]
+            self.outstanding[url] += 1
+            self.sent[url] += 1
+        return url
+
+    def release(self, url):
+        with self.lock:
+            self.outstanding[url] -= 1
+
+    @contextmanager
+    def select(self):
+        url = self.acquire()
+        try:
+            yield url
+        finally:
+            self.release(url)
+
+upstreams = Upstreams()
@@ -0,0 +1,56 @@
+import threading
+import requests
+import transport
+import servertiming
+
+from requests.adapters import HTTPAdapter
+
+from config import *
+from balancer import upstreams
+
+_local = threading.local()
+instrumented = transport.Transport() if phase_timing else None
+
+def new_session(size=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=len(il_upstream_urls), pool_maxsize=size or pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(headers)
+    session.auth = auth
+    session.verify = False
+    return session
+
+def get_session():
+    # one session per worker thread, each with its own keep-alive pool
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = new_session()
+        _local.session = session
+    return session
+
+def request(method, path, mode=None, headers=None, **kwargs):
+    # every request carries its own X-Request-ID, see servertiming.py
+    request_headers = servertiming.begin(headers)
+    if not instrumented:
+        # requests prefers REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE over
+        # session.verify, but not over the verify of the request
+        kwargs.setdefault('verify', False)
+    with upstreams.select() as upstream_url:
+        url = '{}{}'.format(upstream_url, path)
+        if instrumented:
+            response = instrumented.request(method, url, headers=request_headers, close=(mode or connection_mode) == 'cold', **kwargs)
+        elif (mode or connection_mode) == 'cold':
+            # the caller's headers (e.g. a payload Content-Type) are kept
+            with new_session(1) as session:
+                response = session.request(method, url, headers=dict(request_headers, Connection='close'), **kwargs)
+        else:
+            response = get_session().request(method, url, headers=request_headers, **kwargs)
+    servertiming.finish(response.headers)
+    return response
+
+def get(path, mode=None, **kwargs):
+    return request('GET', path, mode, **kwargs)
+
+def post(path, mode=None, **kwargs):
+    return request('POST', path, mode, **kwargs)
@@ -1,3 +1,6 @@
+import os
+import json
+
 from requests.auth import HTTPBasicAuth
 
 il_url = 'https://10.147.72.11'
@@ -12,6 +15,137 @@ cr_url = 'http://10.147.72.15'
 fr_url = 'http://10.147.72.16'
 hwr_url = 'http://10.147.72.17'
 
-il_upstream_url = '{}:{}'.format(il_url, il_channel_port)
-auth = HTTPBasicAuth('tutorial', 'pass')
+username = 'tutorial'
+password = 'pass'
+
+# ENDPOINT_PROFILE selects a named set of the settings above, plus
+# il_upstream_urls and load_balancing, from profiles.json
+endpoint_profile = os.environ.get('ENDPOINT_PROFILE', '')
+endpoint_profiles_file = os.environ.get('ENDPOINT_PROFILES', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles.json'))
+
+def _load_profile(name, file_name):
+    with open(file_name) as profiles:
+        return json.load(profiles)[name]
+
+profile = _load_profile(endpoint_profile, endpoint_profiles_file) if endpoint_profile else {}
+_unknown = set(profile) - {'il_url', 'il_channel_port', 'il_api_port', 'mediator_url', 'shr_url', 'ta_url', 'cr_url', 'fr_url', 'hwr_url',
+                           'username', 'password', 'il_upstream_urls', 'load_balancing'}
+if _unknown:
+    raise ValueError('unknown settings in endpoint profile {}: {}'.format(endpoint_profile, ', '.join(sorted(_unknown))))
+il_url = profile.get('il_url', il_url)
+il_channel_port = profile.get('il_channel_port', il_channel_port)
+il_api_port = profile.get('il_api_port', il_api_port)
+mediator_url = profile.get('mediator_url', mediator_url)
+shr_url = profile.get('shr_url', shr_url)
+ta_url = profile.get('ta_url', ta_url)
+cr_url = profile.get('cr_url', cr_url)
+fr_url = profile.get('fr_url', fr_url)
+hwr_url = profile.get('hwr_url', hwr_url)
+username = profile.get('username', username)
+password = profile.get('password', password)
+
+# requests are spread over every IL replica in il_upstream_urls, see balancer.py
+if os.environ.get('IL_UPSTREAM_URLS'):
+    il_upstream_urls = os.environ['IL_UPSTREAM_URLS'].split(',')
+elif os.environ.get('IL_UPSTREAM_URL'):
+    il_upstream_urls = [os.environ['IL_UPSTREAM_URL']]
+else:
+    il_upstream_urls = profile.get('il_upstream_urls', ['{}:{}'.format(il_url, il_channel_port)])
+il_upstream_url = il_upstream_urls[0]
+# 'round_robin' or 'least_outstanding'
+load_balancing = os.environ.get('LOAD_BALANCING', profile.get('load_balancing', 'round_robin'))
+
+auth = HTTPBasicAuth(os.environ.get('IL_USERNAME', username), os.environ.get('IL_PASSWORD', password))
 headers = {'Content-Type': 'application/json'}
+
+# encounter request bodies, see payloads.py: 'json', 'gzip', 'zstd' or 'multipart'
+payload_encoding = os.environ.get('PAYLOAD_ENCODING', 'json')
+payload_compression_level = int(os.environ.get('PAYLOAD_COMPRESSION_LEVEL', 6))
+
+# connections kept alive per worker session, see client.py
+pool_size = int(os.environ.get('POOL_SIZE', 10))
+# 'warm' reuses keep-alive connections, 'cold' opens a new connection per transaction
+connection_mode = os.environ.get('CONNECTION_MODE', 'warm')
+
+# SOAK_DURATION > 0 cycles the inputs for that many seconds, see soak.py
+soak_duration = float(os.environ.get('SOAK_DURATION', 0))
+soak_window = float(os.environ.get('SOAK_WINDOW', 10))
+# windows needed in each of the early and late thirds to test for drift
+soak_min_windows = int(os.environ.get('SOAK_MIN_WINDOWS', 3))
+drift_alpha = float(os.environ.get('DRIFT_ALPHA', 0.01))
+
+# generated users, see policies.py
+policy_shape = os.environ.get('POLICY_SHAPE', 'mixed')
+policy_vocabulary = int(os.environ.get('POLICY_VOCABULARY', 256))
+policy_fanout = int(os.environ.get('POLICY_FANOUT', 4))
+policy_satisfying = float(os.environ.get('POLICY_SATISFYING', 1.0))
+policy_templates = int(os.environ.get('POLICY_TEMPLATES', 64))
+policy_seed = int(os.environ.get('POLICY_SEED', 0))
+
+# SQLite file of registered users reused across runs, see credentials.py; empty disables it
+credential_store = os.environ.get('CREDENTIAL_STORE', '')
+
+# concurrency ramps, see ramp.py: steps multiply the concurrency by RAMP_FACTOR and each
+# holds until RAMP_STABLE_WINDOWS windows of RAMP_WINDOW seconds agree within RAMP_TOLERANCE
+ramp_start = int(os.environ.get('RAMP_START', 1))
+ramp_factor = float(os.environ.get('RAMP_FACTOR', 2))
+ramp_max = int(os.environ.get('RAMP_MAX', 1024))
+ramp_window = float(os.environ.get('RAMP_WINDOW', 5))
+ramp_stable_windows = int(os.environ.get('RAMP_STABLE_WINDOWS', 3))
+ramp_max_windows = int(os.environ.get('RAMP_MAX_WINDOWS', 12))
+ramp_tolerance = float(os.environ.get('RAMP_TOLERANCE', 0.1))
+# the ramp stops at the first step over either limit
+ramp_max_p99 = float(os.environ.get('RAMP_MAX_P99', 1.0))
+ramp_max_error_rate = float(os.environ.get('RAMP_MAX_ERROR_RATE', 0.01))
+
+# mixed runs, see mix.py: relative weights of each operation and the seed that draws them
+mix_weights = os.environ.get('MIX_WEIGHTS', 'keygen:5,save:30,query:65')
+mix_seed = int(os.environ.get('MIX_SEED', 0))
+
+# rows buffered per column before the writer thread appends them, see resultstore.py
+raw_batch_size = int(os.environ.get('RAW_BATCH_SIZE', 4096))
+
+# PHASE_TIMING=1 times DNS, connect, TLS, upload, TTFB and download separately, see transport.py
+phase_timing = os.environ.get('PHASE_TIMING', '0') == '1'
+
+# ARRIVAL_RATE > 0 runs the open-loop engine in loadgen.py at that many requests/sec
+arrival_rate = float(os.environ.get('ARRIVAL_RATE', 0))
+# 'uniform' spaces arrivals evenly, 'poisson' draws exponential inter-arrival times
+arrival_process = os.environ.get('ARRIVAL_PROCESS', 'uniform')
+max_in_flight = int(os.environ.get('MAX_IN_FLIGHT', 1000))
+# CONCURRENCY > 1 runs that many closed-loop workers in loadgen.py instead of one
+concurrency = int(os.environ.get('CONCURRENCY', 1))
+# appended to summary file names so runs with different settings do not overwrite each other
+run_label = os.environ.get('RUN_LABEL', '')
+
+# worker threads per stage and queue length between stages in pipeline.py
+pipeline_threads = int(os.environ.get('PIPELINE_THREADS', 1))
+pipeline_queue_size = int(os.environ.get('PIPELINE_QUEUE_SIZE', 100))
+
+# live metrics published by the Celery tests, see metrics.py
+metrics_interval = float(os.environ.get('METRICS_INTERVAL', 1))
+metrics_window = float(os.environ.get('METRICS_WINDOW', 60))
+metrics_ttl = int(os.environ.get('METRICS_TTL', 86400))
+
+# run registry in api.py, see registry.py
+registry_cache_size = int(os.environ.get('REGISTRY_CACHE_SIZE', 128))
+registry_ttl = int(os.environ.get('REGISTRY_TTL', 86400))
+
+# retries of failed transactions, see retry.py
+retry_base_delay = float(os.environ.get('RETRY_BASE_DELAY', 0.1))
+retry_max_delay = float(os.environ.get('RETRY_MAX_DELAY', 10))
+retry_max_attempts = int(os.environ.get('RETRY_MAX_ATTEMPTS', 5))
+retry_budget = float(os.environ.get('RETRY_BUDGET', 0.2))
+retry_budget_min = int(os.environ.get('RETRY_BUDGET_MIN', 10))
+
+# local stand-in IL, see mock_il.py
+mock_latency = os.environ.get('MOCK_LATENCY', 'constant:0')
+mock_user_latency = os.environ.get('MOCK_USER_LATENCY', mock_latency)
+mock_save_latency = os.environ.get('MOCK_SAVE_LATENCY', mock_latency)
+mock_query_latency = os.environ.get('MOCK_QUERY_LATENCY', mock_latency)
+mock_error_rate = float(os.environ.get('MOCK_ERROR_RATE', 0))
+mock_key_size = int(os.environ.get('MOCK_KEY_SIZE', 1024))
+mock_store_size = int(os.environ.get('MOCK_STORE_SIZE', 1000))
+mock_max_body_size = int(os.environ.get('MOCK_MAX_BODY_SIZE', 64 * 1024 * 1024))
+mock_certificate = os.environ.get('MOCK_CERTIFICATE', '')
+mock_private_key = os.environ.get('MOCK_PRIVATE_KEY', '')
@@ -0,0 +1,55 @@
+# USAGE:
+# docker exec abeinpos_abe-in-pos_1 python3 connection_test.py <num_txns> [<path>]
+# Sends the same request over new connections (cold) and over one keep-alive
+# connection (warm); the difference is the connection setup/TLS handshake cost.
+import sys
+import os
+import time
+import warnings
+import datetime
+
+from config import *
+
+import client
+
+output_data_dir = 'data'
+
+num_txns = int(sys.argv[1])
+path = sys.argv[2] if len(sys.argv) > 2 else '/'
+
+transaction_summary_file_name = '{}_connection_summary.txt'.format(num_txns)
+transaction_summary_path = os.path.join(output_data_dir, transaction_summary_file_name)
+
+def timed_requests(mode):
+    transaction_times = []
+    for _ in range(num_txns):
+        start = time.time()
+        client.get(path, mode=mode)
+        end = time.time()
+        transaction_times.append(end - start)
+    return transaction_times
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    test_start_date = datetime.datetime.utcnow()
+    # open the warm connection before timing
+    client.get(path)
+    cold_times = timed_requests('cold')
+    warm_times = timed_requests('warm')
+    test_end_date = datetime.datetime.utcnow()
+
+avg_cold = sum(cold_times)/float(num_txns)
+avg_warm = sum(warm_times)/float(num_txns)
+
+with open(transaction_summary_path, "w") as transaction_summary_file:
+    transaction_summary_file.write('Target: {}\n'.format(', '.join(url + path for url in il_upstream_urls)))
+    transaction_summary_file.write('Test start: {}\n'.format(test_start_date))
+    transaction_summary_file.write('Test end: {}\n'.format(test_end_date))
+    transaction_summary_file.write('Total number of transactions: {}\n'.format(2 * num_txns))
+    transaction_summary_file.write('Average transaction time (cold): {}\n'.format(avg_cold))
+    transaction_summary_file.write('Average transaction time (warm): {}\n'.format(avg_warm))
+    transaction_summary_file.write('Average connection setup time: {}\n'.format(avg_cold - avg_warm))
+    transaction_summary_file.write('\n')
+    transaction_summary_file.writelines(["cold, {}\n".format(txn_time) for txn_time in cold_times])
+    transaction_summary_file.write('\n')
+    transaction_summary_file.writelines(["warm, {}\n".format(txn_time) for txn_time in warm_times])
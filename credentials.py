@@ -0,0 +1,109 @@
+# Persistent store of registered users, so that key generation, the most
+# expensive ABE operation, is done once per attribute set instead of once per
+# run. Users are keyed by (policy_size, num_attributes, attribute set) and
+# numbered in registration order within each (policy_size, num_attributes), so
+# runs can look a user up by its attributes or pull users by index; rows are
+# read from SQLite as they are needed and never all loaded at once. Every
+# thread uses its own connection and every registration is committed at once,
+# so a run that dies keeps the users it registered.
+import json
+import sqlite3
+import threading
+
+from config import *
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS users (
+        policy_size INTEGER NOT NULL,
+        num_attributes INTEGER NOT NULL,
+        attribute_set TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        user_id NOT NULL,
+        private_key TEXT NOT NULL,
+        policy TEXT,
+        attributes TEXT NOT NULL,
+        PRIMARY KEY (policy_size, num_attributes, attribute_set)
+    )''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS users_position ON users (policy_size, num_attributes, position)'
+)
+
+COLUMNS = 'user_id, private_key, policy, attributes'
+
+def attribute_set(attributes):
+    return ','.join(sorted(attributes))
+
+def user_from_row(row):
+    user_id, private_key, policy, attributes = row
+    return {
+        'user_id': user_id,
+        'private_key': private_key,
+        'policy': policy,
+        'attributes': json.loads(attributes)
+    }
+
+class CredentialStore(object):
+    def __init__(self, path=None):
+        self.path = path or credential_store
+        self.local = threading.local()
+        connection = self.connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def get(self, policy_size, num_attributes, attributes):
+        row = self.connection().execute('SELECT {} FROM users WHERE policy_size = ? AND num_attributes = ? AND attribute_set = ?'.format(COLUMNS),
+                                        (policy_size, num_attributes, attribute_set(attributes))).fetchone()
+        return user_from_row(row) if row else None
+
+    def put(self, policy_size, num_attributes, user):
+        # the first user registered with an attribute set is kept
+        connection = self.connection()
+        with connection:
+            connection.execute('''INSERT OR IGNORE INTO users
+                SELECT ?, ?, ?, COALESCE(MAX(position) + 1, 0), ?, ?, ?, ? FROM users WHERE policy_size = ? AND num_attributes = ?''',
+                (policy_size, num_attributes, attribute_set(user['attributes']), user['user_id'], user['private_key'],
+                 user.get('policy'), json.dumps(user['attributes']), policy_size, num_attributes))
+
+    def count(self, policy_size, num_attributes):
+        return self.connection().execute('SELECT COUNT(*) FROM users WHERE policy_size = ? AND num_attributes = ?',
+                                         (policy_size, num_attributes)).fetchone()[0]
+
+    def user(self, policy_size, num_attributes, index):
+        row = self.connection().execute('SELECT {} FROM users WHERE policy_size = ? AND num_attributes = ? AND position = ?'.format(COLUMNS),
+                                        (policy_size, num_attributes, index)).fetchone()
+        return user_from_row(row) if row else None
+
+    def users(self, policy_size, num_attributes, start=0, stop=None):
+        # users [start, stop) in registration order
+        cursor = self.connection().execute('SELECT {} FROM users WHERE policy_size = ? AND num_attributes = ? AND position >= ? AND position < ? ORDER BY position'.format(COLUMNS),
+                                           (policy_size, num_attributes, start, 2 ** 62 if stop is None else stop))
+        for rows in iter(lambda: cursor.fetchmany(1000), []):
+            for row in rows:
+                yield user_from_row(row)
+
+    def registered(self, policy_size, num_attributes, user_meta):
+        # the stored user with the attributes of user_meta and its policy, or
+        # None while it is not registered yet
+        user = self.get(policy_size, num_attributes, user_meta['attributes'])
+        return None if user is None else dict(user, policy=user_meta['policy'])
+
+    def resolve(self, policy_size, num_attributes, user):
+        # user records saved without their private key are completed here
+        if 'private_key' in user:
+            return user
+        cached = self.get(policy_size, num_attributes, user['attributes'])
+        if cached is None:
+            raise KeyError('no registered user with attributes {}'.format(attribute_set(user['attributes'])))
+        return cached
+
+def reference(user):
+    # what save runs record of a stored user in place of the whole user
+    return {'user_id': user['user_id'], 'attributes': user['attributes']}
@@ -0,0 +1,94 @@
+# Lazy readers for the harness inputs. JSON Lines files are memory-mapped and
+# decoded one record at a time; legacy files holding a single JSON array are
+# parsed incrementally, so neither format is ever loaded whole.
+import io
+import os
+import json
+import mmap
+import itertools
+
+CHUNK_SIZE = 1 << 20
+
+def _is_json_array(input_file):
+    first = input_file.read(CHUNK_SIZE).lstrip()[:1]
+    input_file.seek(0)
+    return first == b'['
+
+def iter_records(path, start=0, stop=None):
+    # records [start, stop); skipped JSON Lines records are never decoded
+    with open(path, 'rb') as input_file:
+        if _is_json_array(input_file):
+            records = itertools.islice(iter_json_array(input_file), start, stop)
+        elif os.fstat(input_file.fileno()).st_size:
+            records = (json.loads(line.decode('utf-8'))
+                       for line in itertools.islice(iter_json_lines(input_file), start, stop))
+        else:
+            records = iter(())
+        for record in records:
+            yield record
+
+def iter_raw_records(path, start=0, stop=None):
+    # the JSON text of records [start, stop), for requests that send it as is
+    with open(path, 'rb') as input_file:
+        if _is_json_array(input_file):
+            records = (json.dumps(record).encode('utf-8')
+                       for record in itertools.islice(iter_json_array(input_file), start, stop))
+        elif os.fstat(input_file.fileno()).st_size:
+            records = (line.strip() for line in itertools.islice(iter_json_lines(input_file), start, stop))
+        else:
+            records = iter(())
+        for record in records:
+            yield record
+
+def iter_json_lines(input_file):
+    with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+        for line in iter(records.readline, b''):
+            if line.strip():
+                yield line
+
+def iter_json_array(input_file):
+    text_file = io.TextIOWrapper(input_file, encoding='utf-8')
+    decoder = json.JSONDecoder()
+    buffer = text_file.read(CHUNK_SIZE).lstrip()[1:]
+    position = 0
+    eof = False
+    while True:
+        position = _skip_separators(buffer, position)
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+            following = end
+            while following < len(buffer) and buffer[following] in ' \t\r\n':
+                following += 1
+        except ValueError as decode_error:
+            end, error = None, decode_error
+        # a record is complete once a ',' or ']' follows it. One that fails to
+        # decode, or that the buffered text ends after (a number cut at the
+        # chunk boundary, '12' of '123' or '3' of '3.5', decodes to a shorter
+        # number), may run on into the rest of the file; read at least as much
+        # again so large records are decoded in a logarithmic number of tries
+        if not eof and (end is None or following == len(buffer) or buffer[following] not in ',]'):
+            chunk = text_file.read(max(CHUNK_SIZE, len(buffer) - position))
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if end is None:
+            if position >= len(buffer):
+                return
+            raise error
+        position = end
+        yield record
+
+def _skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+def count_records(path):
+    with open(path, 'rb') as input_file:
+        if _is_json_array(input_file):
+            return sum(1 for _ in iter_json_array(input_file))
+        if not os.fstat(input_file.fileno()).st_size:
+            return 0
+        return sum(1 for _ in iter_json_lines(input_file))
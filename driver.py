@@ -0,0 +1,123 @@
+# The run loop shared by key_generation_test.py, save_encounter_test.py and
+# query_encounter_test.py. A Driver sends prepared ((body, body_headers), meta)
+# items one after another, or through loadgen.py with ARRIVAL_RATE or
+# CONCURRENCY, and records every transaction in the first attempt or retry
+# statistics, the raw results and, for soak runs, the windows. A failed
+# transaction, including one that never got a response (status 0), is
+# scheduled for a retry. Once the run is over it writes the summary.
+import os
+import time
+import datetime
+import warnings
+import requests
+
+from config import *
+from histogram import Stats
+from report import atomic_write, write_summary, write_retry_summary, write_settings, write_payload_summary, write_phase_summary, write_server_timing_summary, write_drift_summary
+from retry import RetryScheduler
+from payloads import Payloads
+from resultstore import ResultStore, run_settings
+from soak import WindowSeries, cycle_for
+
+import client
+import transport
+import servertiming
+import loadgen
+
+class Driver(object):
+    def __init__(self, scenario_name, summary_name, scenario, path, success_code, metadata=None, on_success=None, output_data_dir='data'):
+        # scenario is the scenarios.py transaction for loadgen.py and path(meta)
+        # the request path of an item; on_success(meta, contents) is called for
+        # every successful transaction, with the decoded response body
+        self.scenario_name = scenario_name
+        self.scenario = scenario
+        self.path = path
+        self.success_code = success_code
+        self.metadata = dict(run_settings(), **(metadata or {}))
+        self.on_success = on_success
+        self.summary_path = os.path.join(output_data_dir, summary_name + '.txt')
+        self.raw_results_path = os.path.join(output_data_dir, 'raw', summary_name)
+        self.windows_path = os.path.join(output_data_dir, summary_name + '_windows.csv')
+        self.stats = Stats()
+        self.retry_stats = Stats()
+        self.retries = RetryScheduler()
+        self.payloads = Payloads()
+        self.raw_results = None
+        self.windows = None
+        self.succeeded = 0
+        self.test_start_date = None
+        self.test_end_date = None
+
+    def record(self, item, status_code, contents, transaction_time, attempt=0):
+        (body, _), meta = item
+        print(status_code)
+        self.retries.attempted(attempt)
+        if status_code == self.success_code:
+            self.succeeded += 1
+            if self.on_success:
+                self.on_success(meta, contents)
+        else:
+            self.retries.schedule(item, attempt + 1)
+        self.raw_results.record(status_code, transaction_time, len(body), attempt)
+        if self.windows:
+            self.windows.record(status_code, transaction_time)
+        if attempt:
+            self.retry_stats.record(status_code, transaction_time)
+        else:
+            self.stats.record(status_code, transaction_time)
+
+    def send(self, item, attempt=0):
+        # like loadgen.transaction, a request that fails without a response
+        # is recorded as status 0
+        (body, body_headers), meta = item
+        start = time.time()
+        try:
+            response = client.post(self.path(meta), data=body, headers=body_headers)
+            status_code = response.status_code
+            # query responses (decrypted encounters) are not decoded
+            contents = response.json() if status_code == self.success_code and self.on_success else None
+        except requests.RequestException:
+            status_code, contents = 0, None
+        self.record(item, status_code, contents, time.time() - start, attempt)
+
+    def run(self, items):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.raw_results = ResultStore(self.raw_results_path, self.scenario_name, self.metadata)
+            self.windows = WindowSeries(self.success_code) if soak_duration else None
+            if soak_duration:
+                items = cycle_for(items)
+            self.test_start_date = datetime.datetime.utcnow()
+            if arrival_rate or concurrency > 1:
+                loadgen.run(self.scenario, items, self.record)
+            else:
+                for item, attempt in self.retries.interleave(items):
+                    self.send(item, attempt)
+            for item, attempt in self.retries.drain():
+                self.send(item, attempt)
+            self.test_end_date = datetime.datetime.utcnow()
+        self.raw_results.close()
+        if self.windows:
+            self.windows.close()
+            self.windows.write_csv(self.windows_path)
+
+    def write_summary(self, lines=()):
+        # lines are written after the settings, e.g. 'Cached users: 3'
+        with atomic_write(self.summary_path) as transaction_summary_file:
+            write_settings(transaction_summary_file)
+            for line in lines:
+                transaction_summary_file.write(line + '\n')
+            write_summary(transaction_summary_file, self.stats, self.test_start_date, self.test_end_date, self.success_code)
+            transaction_summary_file.write('\n')
+            write_payload_summary(transaction_summary_file, self.payloads)
+            transaction_summary_file.write('\n')
+            if phase_timing:
+                write_phase_summary(transaction_summary_file, transport.phases)
+                transaction_summary_file.write('\n')
+            if servertiming.hops.hops:
+                write_server_timing_summary(transaction_summary_file, servertiming.hops)
+                transaction_summary_file.write('\n')
+            if self.windows:
+                write_drift_summary(transaction_summary_file, self.windows)
+                transaction_summary_file.write('\n')
+            write_retry_summary(transaction_summary_file, self.retry_stats, self.retries, self.succeeded, self.test_start_date, self.test_end_date)
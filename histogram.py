@@ -0,0 +1,132 @@
+# Fixed-memory latency histogram in the style of HdrHistogram. Values are
+# counted in log-linear buckets: every power-of-two range is split into the
+# same number of sub-buckets, 2^(sub_bucket_bits - 1), so the relative error
+# is bounded (at most 1/128, under 0.8%, with the default 8 bits) and memory
+# does not grow with the number of samples. Histograms with the same layout can be merged, which is how results
+# from separate workers, shards or runs are combined.
+SUB_BUCKET_BITS = 8
+
+class Histogram(object):
+    def __init__(self, highest=3600.0, unit=1e-6, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.unit = unit
+        self.sub_bucket_bits = sub_bucket_bits
+        self.highest = int(highest/unit)
+        self.counts = [0] * (self._index(self.highest) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, ticks):
+        if ticks < 1 << self.sub_bucket_bits:
+            return ticks
+        shift = ticks.bit_length() - self.sub_bucket_bits
+        return (shift << (self.sub_bucket_bits - 1)) + (ticks >> shift)
+
+    def _highest_equivalent(self, index):
+        half = 1 << (self.sub_bucket_bits - 1)
+        if index < 2 * half:
+            return index
+        shift = index // half - 1
+        return ((index - shift * half + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        ticks = min(max(int(value/self.unit), 0), self.highest)
+        self.counts[self._index(ticks)] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if (other.unit, other.sub_bucket_bits, other.highest) != (self.unit, self.sub_bucket_bits, self.highest):
+            raise ValueError('cannot merge histograms with different layouts')
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def mean(self):
+        return self.total/self.count if self.count else 0.0
+
+    def percentile(self, percentile):
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * percentile/100.0 + 0.4999999)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                value = round(self._highest_equivalent(index) * self.unit, 9)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'highest': self.highest * self.unit,
+            'counts': {str(index): count for index, count in enumerate(self.counts) if count},
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['highest'], data['unit'], data['sub_bucket_bits'])
+        for index, count in data['counts'].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+class Stats(object):
+    # overall latency plus a breakdown per status code (0 = connection error)
+    def __init__(self):
+        self.latency = Histogram()
+        self.by_status = {}
+
+    def record(self, status_code, latency):
+        self.latency.record(latency)
+        if status_code not in self.by_status:
+            self.by_status[status_code] = Histogram()
+        self.by_status[status_code].record(latency)
+
+    def count(self, status_code=None):
+        if status_code is None:
+            return self.latency.count
+        histogram = self.by_status.get(status_code)
+        return histogram.count if histogram else 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        for status_code, histogram in other.by_status.items():
+            if status_code not in self.by_status:
+                self.by_status[status_code] = Histogram()
+            self.by_status[status_code].merge(histogram)
+        return self
+
+    def to_dict(self):
+        return {
+            'latency': self.latency.to_dict(),
+            'by_status': {str(status_code): histogram.to_dict() for status_code, histogram in self.by_status.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.latency = Histogram.from_dict(data['latency'])
+        stats.by_status = {int(status_code): Histogram.from_dict(histogram) for status_code, histogram in data['by_status'].items()}
+        return stats
@@ -1,26 +1,50 @@
+# USAGE:
+# python3 initialize_test_data.py [<num_encounters> [<synthetic_kb> ...]]
+# Writes test_data/encounters_<size>kb.jsonl, one encounter per line, for the
+# plain sample (8kb), every image in test_data/images and every synthetic size.
+import sys
 import os
 import json
 import base64
+import random
+import itertools
 
 source_dir_name = 'test_data'
 images_dir_name = os.path.join(source_dir_name, 'images')
 
 source_file_name = os.path.join(source_dir_name, 'sample.json')
+output_file_name = os.path.join(source_dir_name, 'encounters_{}.jsonl')
 
 with open(source_file_name, 'r') as source_file:
     encounters = json.load(source_file)
 
-with open(os.path.join(source_dir_name, 'encounters_8kb.json'), 'w') as default_input_file:
-    json.dump(encounters, default_input_file)
+num_encounters = int(sys.argv[1]) if len(sys.argv) > 1 else len(encounters)
+synthetic_sizes = [int(size) for size in sys.argv[2:]]
+
+# each sample encounter is serialized once; the image is spliced in as bytes
+# before the closing brace so it is never copied into a Python object
+encounter_prefixes = [json.dumps(encounter).encode('utf-8')[:-1] for encounter in encounters]
+
+def write_encounters(name, image_bytes=None):
+    if image_bytes is None:
+        suffix = b'}\n'
+    else:
+        suffix = b', "image": "' + base64.b64encode(image_bytes) + b'"}\n'
+    with open(output_file_name.format(name), 'wb') as output_file:
+        for prefix in itertools.islice(itertools.cycle(encounter_prefixes), num_encounters):
+            output_file.write(prefix)
+            output_file.write(suffix)
+
+def synthetic_image(size_kb, seed=0):
+    num_bytes = size_kb * 1024
+    return random.Random(seed).getrandbits(8 * num_bytes).to_bytes(num_bytes, 'little')
+
+write_encounters('8kb')
 
 image_file_names = os.listdir(images_dir_name)
 for image_file_name in image_file_names:
     with open(os.path.join(images_dir_name, image_file_name), 'rb') as image_file:
-        image_bytes = base64.b64encode(image_file.read())
-
-    image_string = str(image_bytes, 'utf-8')
-    for encounter in encounters:
-        encounter['image'] = image_string
+        write_encounters(image_file_name[:-4], image_file.read())
 
-    with open(os.path.join(source_dir_name, 'encounters_{}.json'.format(image_file_name[:-4])), 'w') as output_file_name:
-        json.dump(encounters, output_file_name)
\ No newline at end of file
+for size_kb in synthetic_sizes:
+    write_encounters('{}kb'.format(size_kb), synthetic_image(size_kb))
@@ -0,0 +1,24 @@
+# USAGE:
+# python3 initialize_users.py <num_users> <policy_size> <num_attributes> [<output>|-]
+# Writes num_users generated users (policy and attributes, see policies.py) as
+# JSON Lines to input/run <num_users> <policy_size> <num_attributes>.json, the
+# key generation input, or to stdout with '-'.
+import sys
+import os
+
+from policies import PolicyGenerator
+
+test_data_dir = 'input'
+
+num_users = int(sys.argv[1])
+policy_size = int(sys.argv[2])
+num_attributes = int(sys.argv[3])
+output_file_name = sys.argv[4] if len(sys.argv) > 4 else os.path.join(test_data_dir, 'run {} {} {}.json'.format(num_users, policy_size, num_attributes))
+
+generator = PolicyGenerator(policy_size, num_attributes)
+
+if output_file_name == '-':
+    sys.stdout.writelines(generator.lines(num_users))
+else:
+    with open(output_file_name, 'w', buffering=1 << 20) as output_file:
+        output_file.writelines(generator.lines(num_users))
@@ -0,0 +1,125 @@
+# Asyncio load engine. In open-loop mode transactions are started on a fixed
+# schedule derived from the target arrival rate, whether or not earlier ones
+# have finished, and latency is measured from the scheduled send time so that
+# a slow server cannot hide queueing delay (coordinated omission). In
+# closed-loop mode a fixed number of workers each send the next transaction as
+# soon as the previous one completes.
+import time
+import random
+import asyncio
+import aiohttp
+
+from config import *
+from transport import phases
+
+def phase_trace():
+    # the aiohttp counterpart of transport.py; TLS is part of connect here,
+    # and scenarios.py times the download
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.timings = {}
+        context.ready = time.perf_counter()
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.resolving = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        context.timings['dns'] = time.perf_counter() - context.resolving
+
+    async def on_connection_create_start(session, context, params):
+        context.connecting = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        context.ready = time.perf_counter()
+        context.timings['connect'] = context.ready - context.connecting - context.timings.get('dns', 0.0)
+
+    async def on_connection_reuseconn(session, context, params):
+        context.ready = time.perf_counter()
+
+    async def on_request_chunk_sent(session, context, params):
+        context.sent = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        sent = getattr(context, 'sent', context.ready)
+        context.timings['upload'] = sent - context.ready
+        context.timings['ttfb'] = time.perf_counter() - sent
+        phases.record(context.timings)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace.on_connection_create_start.append(on_connection_create_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace.on_request_chunk_sent.append(on_request_chunk_sent)
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+def new_session(limit=None):
+    connector = aiohttp.TCPConnector(limit=limit or max_in_flight,
+                                     force_close=connection_mode == 'cold',
+                                     ssl=False)
+    return aiohttp.ClientSession(connector=connector,
+                                 headers=headers,
+                                 auth=aiohttp.BasicAuth(auth.username, auth.password),
+                                 trace_configs=[phase_trace()] if phase_timing else None)
+
+def arrival_times(start, rate, process=None):
+    scheduled = start
+    while True:
+        yield scheduled
+        if (process or arrival_process) == 'poisson':
+            scheduled += random.expovariate(rate)
+        else:
+            scheduled += 1.0/rate
+
+async def transaction(scenario, session, item, scheduled, on_result):
+    loop = asyncio.get_event_loop()
+    try:
+        status_code, contents = await scenario(session, item)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        status_code, contents = 0, None
+    on_result(item, status_code, contents, loop.time() - scheduled)
+
+async def run_open_loop(scenario, items, on_result, rate, process=None):
+    loop = asyncio.get_event_loop()
+    in_flight = set()
+    async with new_session() as session:
+        schedule = arrival_times(loop.time(), rate, process)
+        for item, scheduled in zip(items, schedule):
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = loop.create_task(transaction(scenario, session, item, scheduled, on_result))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+async def run_closed_loop(scenario, items, on_result, concurrency):
+    loop = asyncio.get_event_loop()
+    items = iter(items)
+
+    async def worker(session):
+        for item in items:
+            await transaction(scenario, session, item, loop.time(), on_result)
+
+    async with new_session(concurrency) as session:
+        await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+
+def complete(engine):
+    # runs one of the engines above on a fresh event loop
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(engine)
+    finally:
+        loop.close()
+
+def run(scenario, items, on_result, rate=None, process=None, workers=None):
+    # open loop when an arrival rate is given, closed loop otherwise
+    rate = rate or arrival_rate
+    if rate:
+        complete(run_open_loop(scenario, items, on_result, rate, process))
+    else:
+        complete(run_closed_loop(scenario, items, on_result, workers or concurrency))
@@ -0,0 +1,128 @@
+# Live metrics for running tests. Workers record into a local Stats object;
+# a background thread swaps it out every metrics_interval seconds and pushes
+# the batch to Redis in one pipeline, so the request loop never waits on Redis.
+# Each batch is kept as a histogram window and readers merge the most recent
+# windows for rolling throughput and percentiles.
+import json
+import time
+import threading
+import redis
+
+from config import *
+from histogram import Stats, Histogram
+
+runs_key = 'metrics:runs'
+run_key = 'metrics:{}'
+windows_key = 'metrics:{}:windows'
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+class MetricsPublisher(object):
+    def __init__(self, redis_url, run_id, scenario, success_code, interval=None, window=None):
+        self.redis = redis.StrictRedis.from_url(redis_url)
+        self.run_id = run_id
+        self.success_code = success_code
+        self.interval = interval or metrics_interval
+        self.max_windows = max(1, int((window or metrics_window)/self.interval))
+        self.pending = Stats()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # shards of a distributed run share one run_id, so only the first sets the start time
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(runs_key, {run_id: time.time()})
+        pipe.hsetnx(run_key.format(run_id), 'started', time.time())
+        pipe.hset(run_key.format(run_id), mapping={'scenario': scenario, 'state': 'running'})
+        pipe.execute()
+        self.thread = threading.Thread(target=self.publish_periodically)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, status_code, latency):
+        with self.lock:
+            self.pending.record(status_code, latency)
+
+    def publish_periodically(self):
+        while not self.stopped.wait(self.interval):
+            self.publish()
+
+    def publish(self, state=None):
+        with self.lock:
+            batch, self.pending = self.pending, Stats()
+        now = time.time()
+        key = run_key.format(self.run_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if batch.count():
+            completed = batch.count(self.success_code)
+            pipe.hincrby(key, 'completed', completed)
+            pipe.hincrby(key, 'failed', batch.count() - completed)
+            for status_code, histogram in batch.by_status.items():
+                pipe.hincrby(key, 'status:{}'.format(status_code), histogram.count)
+        pipe.rpush(windows_key.format(self.run_id), json.dumps({'time': now, 'span': self.interval, 'latency': batch.latency.to_dict()}))
+        pipe.ltrim(windows_key.format(self.run_id), -self.max_windows, -1)
+        pipe.hset(key, 'updated', now)
+        if state:
+            pipe.hset(key, 'state', state)
+        pipe.zadd(runs_key, {self.run_id: now})
+        pipe.expire(key, metrics_ttl)
+        pipe.expire(windows_key.format(self.run_id), metrics_ttl)
+        pipe.execute()
+
+    def close(self, state='finished'):
+        self.stopped.set()
+        self.thread.join()
+        self.publish(state)
+
+def set_state(redis_url, run_id, state):
+    redis.StrictRedis.from_url(redis_url).hset(run_key.format(run_id), 'state', state)
+
+def read_metrics(redis_client, run_id):
+    values = redis_client.hgetall(run_key.format(run_id))
+    if not values:
+        return None
+    values = {key.decode('utf-8'): value.decode('utf-8') for key, value in values.items()}
+    windows = [json.loads(window) for window in redis_client.lrange(windows_key.format(run_id), 0, -1)]
+    latency = Histogram()
+    for window in windows:
+        latency.merge(Histogram.from_dict(window['latency']))
+    span = 0.0
+    if windows:
+        span = windows[-1]['time'] - windows[0]['time'] + windows[0]['span']
+    return {
+        'run_id': run_id,
+        'scenario': values.get('scenario'),
+        'state': values.get('state'),
+        'started': float(values.get('started', 0)),
+        'updated': float(values.get('updated', 0)),
+        'completed': int(values.get('completed', 0)),
+        'failed': int(values.get('failed', 0)),
+        'status_codes': {key.split(':', 1)[1]: int(value) for key, value in values.items() if key.startswith('status:')},
+        'throughput': latency.count/span if span else 0.0,
+        'latency': {'p{}'.format(percentile): latency.percentile(percentile) for percentile in PERCENTILES}
+    }
+
+def read_all_metrics(redis_client, since=None):
+    since = since if since is not None else time.time() - metrics_ttl
+    run_ids = [run_id.decode('utf-8') for run_id in redis_client.zrangebyscore(runs_key, since, '+inf')]
+    return [metrics for metrics in (read_metrics(redis_client, run_id) for run_id in run_ids) if metrics]
+
+def prometheus_text(all_metrics):
+    lines = [
+        '# HELP abe_test_transactions_total Completed transactions of running and recent tests.',
+        '# TYPE abe_test_transactions_total counter'
+    ]
+    for metrics in all_metrics:
+        for status_code, count in sorted(metrics['status_codes'].items()):
+            lines.append('abe_test_transactions_total{{run_id="{}",scenario="{}",status="{}"}} {}'.format(
+                metrics['run_id'], metrics['scenario'], status_code, count))
+    lines.append('# HELP abe_test_throughput Transactions per second over the rolling window.')
+    lines.append('# TYPE abe_test_throughput gauge')
+    for metrics in all_metrics:
+        lines.append('abe_test_throughput{{run_id="{}",scenario="{}"}} {}'.format(
+            metrics['run_id'], metrics['scenario'], metrics['throughput']))
+    lines.append('# HELP abe_test_latency_seconds Rolling transaction latency quantiles.')
+    lines.append('# TYPE abe_test_latency_seconds gauge')
+    for metrics in all_metrics:
+        for percentile in PERCENTILES:
+            lines.append('abe_test_latency_seconds{{run_id="{}",scenario="{}",quantile="{}"}} {}'.format(
+                metrics['run_id'], metrics['scenario'], percentile/100.0, metrics['latency']['p{}'.format(percentile)]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,111 @@
+# Mixed workload: keygen, save and query transactions drawn at random in the
+# MIX_WEIGHTS proportions and run together by the loadgen.py engines. Saves
+# pick a user from a pool seeded with an earlier key generation run and grown
+# by every user this run registers; queries pick an encounter from a pool
+# grown the same way by every save. An operation whose pool is still empty
+# falls back to the one that fills it (query to save, save to keygen).
+import random
+import itertools
+
+from array import array
+
+from config import *
+from histogram import Stats
+from payloads import Payloads, BodyStore
+from soak import cycle
+
+import scenarios
+
+OPERATIONS = ('keygen', 'save', 'query')
+
+SUCCESS_CODES = {
+    'keygen': 200,
+    'save': 201,
+    'query': 200
+}
+
+OPERATION_SCENARIOS = {
+    'keygen': scenarios.save_user,
+    'save': scenarios.save,
+    'query': scenarios.query
+}
+
+def parse_weights(spec):
+    # 'keygen:5,save:30,query:65'
+    weights = dict((operation, 0.0) for operation in OPERATIONS)
+    for part in spec.split(','):
+        operation, _, weight = part.partition(':')
+        if operation.strip() not in weights:
+            raise ValueError('unknown operation {} in MIX_WEIGHTS'.format(operation))
+        weights[operation.strip()] = float(weight)
+    return weights
+
+class Mix(object):
+    def __init__(self, users_meta, encounters, users=(), encounter_ids=(), weights=None, seed=None, resolve=None):
+        self.weights = parse_weights(weights or mix_weights)
+        self.random = random.Random(mix_seed if seed is None else seed)
+        self.payloads = Payloads()
+        # key generation bodies do not depend on the pools and are prepared
+        # up front from users_meta, a callable returning the users to
+        # register; save and query bodies are built when their item is drawn,
+        # before the transaction is timed
+        self.user_items = self.payloads.prepare(users_meta, lambda user_meta: self.payloads.json({'attributes': user_meta['attributes']}))
+        self.keygen_items = cycle(self.user_items)
+        self.records = BodyStore()
+        self.encounters = array('Q', (self.records.add(record) for record in encounters))
+        self.users = list(users)
+        self.encounter_ids = list(encounter_ids)
+        # resolve(user) completes users of saved encounters recorded without
+        # their private key (CredentialStore.resolve)
+        self.resolve = resolve or (lambda user: user)
+        self.stats = dict((operation, Stats()) for operation in OPERATIONS)
+        self.turns = itertools.count()
+        if not self.user_items and not self.users:
+            raise ValueError('a mixed run needs user attributes or registered users')
+        if not self.encounters and not self.encounter_ids:
+            raise ValueError('a mixed run needs encounters or saved encounter IDs')
+
+    def choose(self):
+        operation = self.random.choices(OPERATIONS, [self.weights[operation] for operation in OPERATIONS])[0]
+        if operation == 'query' and not self.encounter_ids:
+            operation = 'save'
+        if operation == 'save' and (not self.users or not self.encounters):
+            operation = 'keygen' if self.user_items else 'query'
+        if operation == 'keygen' and not self.user_items:
+            operation = 'save' if self.encounters else 'query'
+        return operation
+
+    def next_item(self):
+        operation = self.choose()
+        turn = next(self.turns)
+        if operation == 'keygen':
+            return operation, next(self.keygen_items)
+        if operation == 'save':
+            user = self.random.choice(self.users)
+            record = bytes(self.records.get(self.encounters[turn % len(self.encounters)]))
+            return operation, (self.payloads.encounter(record, user), user)
+        encounter_id, user = self.random.choice(self.encounter_ids)
+        return operation, (self.payloads.json({'private_key': self.resolve(user)['private_key']}), (encounter_id, user))
+
+    def items(self):
+        while True:
+            yield self.next_item()
+
+    async def transaction(self, session, item):
+        operation, operation_item = item
+        return await OPERATION_SCENARIOS[operation](session, operation_item)
+
+    def record(self, item, status_code, contents, latency):
+        operation, ((body, _), meta) = item
+        self.stats[operation].record(status_code, latency)
+        if status_code != SUCCESS_CODES[operation]:
+            return
+        if operation == 'keygen':
+            self.users.append({
+                'user_id': contents['user_id'],
+                'private_key': contents['private_key'],
+                'policy': meta['policy'],
+                'attributes': meta['attributes']
+            })
+        elif operation == 'save':
+            self.encounter_ids.append((contents['encounter_id'], meta))
@@ -0,0 +1,95 @@
+# USAGE:
+# docker exec abeinpos_abe-in-pos_1 python3 mixed_workload_test.py <policy_size> <num_attributes> <num_users> <num_txns>_encounters.jsonl
+# Runs <num_txns> transactions (or SOAK_DURATION seconds) of the MIX_WEIGHTS
+# mix with CONCURRENCY workers, or open-loop at ARRIVAL_RATE. New users take
+# their attributes from 'run <num_users> <policy_size> <num_attributes>.json';
+# users_<policy_size>_<num_attributes>_<num_users>.jsonl and
+# <num_txns>_encounter_ids_<policy_size>_<num_attributes>.jsonl seed the pools
+# when they exist.
+import sys
+import os
+import datetime
+import warnings
+import itertools
+
+from config import *
+from report import write_summary, write_settings, write_payload_summary, write_phase_summary, write_server_timing_summary, summary_suffix
+from datasets import iter_records, iter_raw_records
+from resultstore import ResultStore, run_settings
+from mix import Mix, OPERATIONS, SUCCESS_CODES
+from credentials import CredentialStore
+from soak import run_for
+
+import transport
+import servertiming
+import loadgen
+
+test_data_dir = 'input'
+output_data_dir = 'data'
+
+policy_size = int(sys.argv[1])
+num_attributes = int(sys.argv[2])
+num_users = int(sys.argv[3])
+input_filename = sys.argv[4]
+
+num_txns_str = input_filename.split("_")[0]
+
+test_users_path = os.path.join(test_data_dir, 'run {} {} {}.json'.format(num_users, policy_size, num_attributes))
+users_path = os.path.join(test_data_dir, 'users_{}_{}_{}.jsonl'.format(policy_size, num_attributes, num_users))
+encounter_ids_path = os.path.join(test_data_dir, '{}_encounter_ids_{}_{}.jsonl'.format(num_txns_str, policy_size, num_attributes))
+input_path = os.path.join(test_data_dir, input_filename)
+
+transaction_summary_file_name = '{}_{}_{}_mixed_summary{}.txt'.format(policy_size, num_attributes, num_txns_str, summary_suffix())
+transaction_summary_path = os.path.join(output_data_dir, transaction_summary_file_name)
+raw_results_path = os.path.join(output_data_dir, 'raw', os.path.splitext(transaction_summary_file_name)[0])
+
+credentials = CredentialStore() if credential_store else None
+
+def optional_records(path):
+    return iter_records(path) if os.path.exists(path) else iter(())
+
+mix = Mix(lambda: optional_records(test_users_path),
+          iter_raw_records(input_path),
+          optional_records(users_path),
+          ((encounter['encounter_id'], encounter['user']) for encounter in optional_records(encounter_ids_path)),
+          resolve=(lambda user: credentials.resolve(policy_size, num_attributes, user)) if credentials else None)
+initial_users = len(mix.users)
+initial_encounters = len(mix.encounter_ids)
+
+def record(item, status_code, contents, transaction_time):
+    operation, (prepared, _) = item
+    print(status_code)
+    mix.record(item, status_code, contents, transaction_time)
+    raw_results.record(status_code, transaction_time, len(prepared[0]), scenario=operation)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    if soak_duration:
+        items = run_for(mix.items())
+    else:
+        items = itertools.islice(mix.items(), int(num_txns_str))
+    raw_results = ResultStore(raw_results_path, 'mixed', dict(run_settings(), policy_size=policy_size, num_attributes=num_attributes,
+                                                              input=input_filename, mix_weights=mix.weights))
+    test_start_date = datetime.datetime.utcnow()
+    loadgen.run(mix.transaction, items, record)
+    test_end_date = datetime.datetime.utcnow()
+
+raw_results.close()
+print("number of transactions: {}".format(sum(stats.count() for stats in mix.stats.values())))
+
+with open(transaction_summary_path, "w") as transaction_summary_file:
+    write_settings(transaction_summary_file)
+    transaction_summary_file.write('Mix: {}\n'.format(', '.join('{} {}'.format(operation, mix.weights[operation]) for operation in OPERATIONS)))
+    transaction_summary_file.write('Users in pool: {} ({} at start)\n'.format(len(mix.users), initial_users))
+    transaction_summary_file.write('Encounters in pool: {} ({} at start)\n'.format(len(mix.encounter_ids), initial_encounters))
+    for operation in OPERATIONS:
+        transaction_summary_file.write('\nOperation: {}\n'.format(operation))
+        write_summary(transaction_summary_file, mix.stats[operation], test_start_date, test_end_date, SUCCESS_CODES[operation])
+    transaction_summary_file.write('\n')
+    write_payload_summary(transaction_summary_file, mix.payloads)
+    if phase_timing:
+        transaction_summary_file.write('\n')
+        write_phase_summary(transaction_summary_file, transport.phases)
+    if servertiming.hops.hops:
+        transaction_summary_file.write('\n')
+        write_server_timing_summary(transaction_summary_file, servertiming.hops)
@@ -0,0 +1,141 @@
+# USAGE:
+# python3 mock_il.py [<port>]
+# Local stand-in for the interoperability layer, for running and profiling the
+# harness off the test network: IL_UPSTREAM_URL=http://localhost:<port> points
+# the load generators at it. It serves /user, /encounters/ and
+# /encounters/<id> with the same status codes and response fields as the IL,
+# after a latency drawn from MOCK_*_LATENCY and failing MOCK_ERROR_RATE of the
+# requests with a 500. Responses echo X-Request-ID and report the drawn latency
+# and the rest of the handler as the Server-Timing hops 'abe' and 'il' (see
+# servertiming.py). Encounters may also be saved gzip-compressed or as
+# multipart uploads (see payloads.py). Latencies are '<distribution>:<parameters>':
+#   constant:<seconds>, uniform:<low>,<high>, exponential:<mean>,
+#   lognormal:<mu>,<sigma> (of the underlying normal, in log-seconds)
+import sys
+import ssl
+import json
+import uuid
+import base64
+import random
+import asyncio
+import itertools
+import time
+
+from collections import OrderedDict
+from aiohttp import web
+
+from config import *
+from servertiming import REQUEST_ID_HEADER, SERVER_TIMING_HEADER
+
+def parse_latency(spec):
+    distribution, _, parameters = spec.partition(':')
+    parameters = [float(parameter) for parameter in parameters.split(',') if parameter]
+    if distribution == 'constant':
+        return lambda: parameters[0]
+    if distribution == 'uniform':
+        return lambda: random.uniform(parameters[0], parameters[1])
+    if distribution == 'exponential':
+        return lambda: random.expovariate(1.0/parameters[0]) if parameters[0] else 0.0
+    if distribution == 'lognormal':
+        return lambda: random.lognormvariate(parameters[0], parameters[1])
+    raise ValueError('unknown latency distribution {}'.format(spec))
+
+@web.middleware
+async def server_timing(request, handler):
+    start = time.perf_counter()
+    response = await handler(request)
+    total = time.perf_counter() - start
+    abe = request.get('abe', 0.0)
+    response.headers[SERVER_TIMING_HEADER] = 'abe;dur={:.3f}, il;dur={:.3f}'.format(abe * 1000, (total - abe) * 1000)
+    if REQUEST_ID_HEADER in request.headers:
+        response.headers[REQUEST_ID_HEADER] = request.headers[REQUEST_ID_HEADER]
+    return response
+
+class MockInteroperabilityLayer(object):
+    def __init__(self, user_latency=None, save_latency=None, query_latency=None, error_rate=None, key_size=None, store_size=None):
+        self.latencies = {
+            'user': parse_latency(user_latency or mock_user_latency),
+            'save': parse_latency(save_latency or mock_save_latency),
+            'query': parse_latency(query_latency or mock_query_latency)
+        }
+        self.error_rate = mock_error_rate if error_rate is None else error_rate
+        self.key_size = mock_key_size if key_size is None else key_size
+        self.store_size = mock_store_size if store_size is None else store_size
+        # most recently saved encounter bodies, returned as-is by queries
+        self.encounters = OrderedDict()
+        self.encounter_ids = itertools.count(1)
+
+    async def respond(self, request, operation):
+        # the drawn latency stands in for the ABE work of the IL
+        delay = self.latencies[operation]()
+        if delay > 0:
+            start = time.perf_counter()
+            await asyncio.sleep(delay)
+            request['abe'] = time.perf_counter() - start
+        return random.random() >= self.error_rate
+
+    def error(self):
+        return web.json_response({'message': 'Injected error.'}, status=500)
+
+    async def save_user(self, request):
+        await request.read()
+        if not await self.respond(request, 'user'):
+            return self.error()
+        private_key = base64.b64encode(random.getrandbits(8 * self.key_size).to_bytes(self.key_size, 'little')).decode('utf-8')
+        return web.json_response({'user_id': str(uuid.uuid4()), 'private_key': private_key}, status=200)
+
+    async def read_encounter(self, request):
+        # gzip bodies are decompressed by aiohttp; multipart uploads are
+        # stored as the equivalent JSON encounter
+        if not request.content_type.startswith('multipart/'):
+            return await request.read()
+        encounter = {}
+        image = None
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'image':
+                image = await part.read()
+            else:
+                encounter.update(await part.json())
+        if image is not None:
+            encounter['image'] = base64.b64encode(image).decode('utf-8')
+        return json.dumps(encounter).encode('utf-8')
+
+    async def save_encounter(self, request):
+        body = await self.read_encounter(request)
+        if not await self.respond(request, 'save'):
+            return self.error()
+        encounter_id = next(self.encounter_ids)
+        if self.store_size:
+            self.encounters[encounter_id] = body
+            if len(self.encounters) > self.store_size:
+                self.encounters.popitem(last=False)
+        return web.json_response({'encounter_id': encounter_id}, status=201)
+
+    async def query_encounter(self, request):
+        await request.read()
+        if not await self.respond(request, 'query'):
+            return self.error()
+        encounter_id = int(request.match_info['encounter_id'])
+        body = self.encounters.get(encounter_id)
+        if body is None:
+            return web.json_response({'encounter_id': encounter_id}, status=200)
+        return web.Response(body=body, status=200, content_type='application/json')
+
+    def application(self):
+        app = web.Application(client_max_size=mock_max_body_size, middlewares=[server_timing])
+        app.router.add_post('/user', self.save_user)
+        app.router.add_post('/encounters/', self.save_encounter)
+        app.router.add_post(r'/encounters/{encounter_id:\d+}', self.query_encounter)
+        return app
+
+def ssl_context():
+    if not mock_certificate:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(mock_certificate, mock_private_key)
+    return context
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else il_channel_port
+    web.run_app(MockInteroperabilityLayer().application(), port=port, ssl_context=ssl_context())
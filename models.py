@@ -2,201 +2,348 @@ import os
 import time
 import json
 import datetime
+import threading
 import requests
-import concurrent.futures
 
-from requests.auth import HTTPBasicAuth
 from multiprocessing.pool import ThreadPool
 
 from config import *
-import traceback
 
-from app import celery
+from celery import chord
+
+from app import app, celery
+from histogram import Stats
+from report import atomic_write, write_summary
+from datasets import iter_records, iter_raw_records, count_records
+from payloads import Payloads
+from resultstore import ResultStore, run_settings
+from credentials import CredentialStore, reference
+from metrics import MetricsPublisher, set_state
+
+import client
 
 test_data_dir = 'test_data'
 test_users_file_name = os.path.join(test_data_dir, 'users_{}_{}.json')
-test_encounters_file_name = os.path.join(test_data_dir, 'encounters_{}kb.json')
+test_encounters_file_name = os.path.join(test_data_dir, 'encounters_{}kb.jsonl')
 
 results_dir = 'results'
 
-users_file_name = 'users_{}_{}.json'
-encounter_ids_file_name = 'encounter_ids.json'
-encounters_file_name = 'encounters.json'
+users_file_name = 'users_{}_{}.jsonl'
+encounter_ids_file_name = 'encounter_ids.jsonl'
+encounters_file_name = 'encounters.jsonl'
 
 keygen_file_name = os.path.join(results_dir, 'time_key_generation_{}_{}_{}_{}_{}.txt')
 save_file_name = os.path.join(results_dir, 'time_save_encounter_{}_{}_{}_{}_{}.txt')
 query_file_name = os.path.join(results_dir, 'time_query_encounter_{}_{}_{}_{}_{}.txt')
 
+# fan-out runs: <num_shards>_shards_<num_threads>_<num_users>_<file_size>_<policy_size>_<num_attributes>
+distributed_file_names = {
+    'keygen': os.path.join(results_dir, 'time_key_generation_{}_shards_{}_{}_{}_{}_{}.txt'),
+    'save': os.path.join(results_dir, 'time_save_encounter_{}_shards_{}_{}_{}_{}_{}.txt'),
+    'query': os.path.join(results_dir, 'time_query_encounter_{}_shards_{}_{}_{}_{}_{}.txt')
+}
+
 if not os.path.exists(results_dir):
     os.mkdir(results_dir)
 
-@celery.task()
-def key_generation_test(num_threads, num_users, file_size, policy_size, num_attributes):
-    with open(test_users_file_name.format(policy_size, num_attributes), 'r') as users_file:
-        users_meta = json.load(users_file)
-
-    transaction_times = []
-    users = []
-    
-    def save_user(user_meta):
-        user_object = {
-            'first_name': user_meta['attributes'][0],
-            'last_name': user_meta['attributes'][1],
-            'attributes': user_meta['attributes'][2:]
-        }
-        start = time.time()
-        result = requests.post('{}/user'.format(il_upstream_url),
-                            json=user_object,
-                            headers=headers,
-                            auth=auth)
-        end = time.time()
-        print(result.status_code)
-        transaction_time = end - start
-        contents = result.json()
-        transaction_times.append(transaction_time)
-        users.append({
-            'user_id': contents['user_id'],
-            'private_key': contents['private_key'],
-            'policy': user_meta['policy'],
-            'attributes': user_meta['attributes']
-        })
+def run_concurrently(num_threads, func, args_list):
+    # apply_async keeps num_threads transactions in flight; the semaphore bounds
+    # how far submission runs ahead of the workers so the task queue stays small
+    pool = ThreadPool(num_threads)
+    slots = threading.BoundedSemaphore(num_threads * 2)
+    errors = []
 
-    pool = ThreadPool(num_users)
+    def done(result):
+        slots.release()
 
-    test_start_date = datetime.datetime.utcnow()
+    def failed(error):
+        errors.append(error)
+        slots.release()
 
-    for user_meta in users_meta:
-        pool.apply(save_user, (user_meta,))
+    for args in args_list:
+        slots.acquire()
+        pool.apply_async(func, args, callback=done, error_callback=failed)
 
     pool.close()
     pool.join()
-    test_end_date = datetime.datetime.utcnow()
-
-    with open(users_file_name.format(policy_size, num_attributes), 'w') as users_file:
-        print(len(users))
-        json.dump(users, users_file)
-
-    with open(keygen_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes), 'w') as transaction_times_file:
-        total_time = sum(transaction_times)
-        num_transactions = len(transaction_times)
-        avg_txn_time = total_time/float(num_transactions)
-        rate = 1/avg_txn_time
-        transaction_times_file.write('Key Generation Test - {} Thread, {} User, {} kb, {} attributes in policy, {} attributes in key\n'.format(
-            num_threads, num_users, file_size, policy_size, num_attributes
-        ))
-        transaction_times_file.write('Test start: {}\n'.format(test_start_date))
-        transaction_times_file.write('Test end: {}\n'.format(test_end_date))
-        transaction_times_file.write('Total number of transactions: {}\n'.format(num_transactions))
-        transaction_times_file.write('Total time: {}\n'.format(total_time))
-        transaction_times_file.write('Average transaction time: {}\n'.format(avg_txn_time))
-        transaction_times_file.write('Transactions per second: {}\n'.format(rate))
-        transaction_times_file.write('\n')
-        transaction_times_file.writelines(["{}\n".format(txn_time) for txn_time in transaction_times])        
-
-@celery.task()
-def save_encounter_test(num_threads, num_users, file_size, policy_size, num_attributes):
-    with open(test_encounters_file_name.format(file_size), 'r') as encounters_file:
-        encounters = json.load(encounters_file)
-    with open(users_file_name.format(policy_size, num_attributes), 'r') as users_file:
-        users = json.load(users_file)
-
-    pool = ThreadPool(num_users)
-
-    transaction_times = []
-    encounter_ids = []
-
-    def save(encounter, user):
-        encounter['policy'] = user['policy']
-        encounter['user_id'] = user['user_id']
+    if errors:
+        raise errors[0]
+
+def run_transactions(num_threads, items, path, success_code, on_success, metrics=None, raw_results=None):
+    # sends every ((body, body_headers), meta) item to path(meta) and calls
+    # on_success(meta, response) for each success; a request that fails
+    # without a response is recorded as status 0, like loadgen.transaction
+    stats = Stats()
+    lock = threading.Lock()
+
+    def send(prepared, meta):
+        body, body_headers = prepared
         start = time.time()
-        response = requests.post('{}/encounters/'.format(il_upstream_url), json=encounter, headers=headers, auth=auth)
+        try:
+            response = client.post(path(meta), data=body, headers=body_headers)
+            status_code = response.status_code
+        except requests.RequestException:
+            response, status_code = None, 0
         end = time.time()
-        print(response.status_code)
+        print(status_code)
         transaction_time = end - start
-        transaction_times.append(transaction_time)
-        encounter_ids.append(response.json()['encounter_id'])
+        with lock:
+            stats.record(status_code, transaction_time)
+            if metrics:
+                metrics.record(status_code, transaction_time)
+            if raw_results:
+                raw_results.record(status_code, transaction_time, len(body))
+            if status_code == success_code:
+                on_success(meta, response)
+
+    run_concurrently(num_threads, send, items)
+    return stats
+
+def key_generation(num_threads, user_items, save_result, metrics=None, raw_results=None):
+    def registered(user_meta, response):
+        contents = response.json()
+        save_result({
+            'user_id': contents['user_id'],
+            'private_key': contents['private_key'],
+            'policy': user_meta['policy'],
+            'attributes': user_meta['attributes']
+        })
 
-    pool = ThreadPool(num_users)
+    return run_transactions(num_threads, user_items, lambda user_meta: '/user', 200, registered, metrics, raw_results)
 
-    test_start_date = datetime.datetime.utcnow()
-    for encounter, user in zip(encounters, users):
-        pool.apply(save, (encounter, user))
+def save_encounters(num_threads, encounter_items, save_result, metrics=None, raw_results=None):
+    # every encounter ID is saved with its user, as save_encounter_test.py
+    # does, so queries do not depend on the order saves finished in
+    def saved(user, response):
+        save_result({
+            'user': reference(user) if credential_store else user,
+            'encounter_id': response.json()['encounter_id']
+        })
 
-    pool.close()
-    pool.join()
-    test_end_date = datetime.datetime.utcnow()
-
-    with open(encounter_ids_file_name, 'w') as encounter_ids_file:
-        print(len(encounter_ids))
-        json.dump(encounter_ids, encounter_ids_file)
-
-    with open(save_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes), 'w') as transaction_times_file:
-        total_time = sum(transaction_times)
-        num_transactions = len(transaction_times)
-        avg_txn_time = total_time/float(num_transactions)
-        rate = 1/avg_txn_time
-        transaction_times_file.write('Save Encounter Test - {} Thread, {} User, {} kb, {} attributes in policy, {} attributes in key\n'.format(
-            num_threads, num_users, file_size, policy_size, num_attributes
+    return run_transactions(num_threads, encounter_items, lambda user: '/encounters/', 201, saved, metrics, raw_results)
+
+def query_encounters(num_threads, query_items, save_result, metrics=None, raw_results=None):
+    return run_transactions(num_threads, query_items, lambda encounter: '/encounters/{}'.format(encounter[0]), 200,
+                            lambda encounter, response: save_result(response.json()), metrics, raw_results)
+
+def scenario_input_file_names(scenario, file_size, policy_size, num_attributes):
+    if scenario == 'keygen':
+        return [test_users_file_name.format(policy_size, num_attributes)]
+    if scenario == 'save':
+        return [test_encounters_file_name.format(file_size), users_file_name.format(policy_size, num_attributes)]
+    return [encounter_ids_file_name]
+
+def scenario_users(file_name, policy_size, num_attributes, start=0, stop=None):
+    # registered users, pulled from the credential store when there is one
+    if credential_store:
+        return CredentialStore().users(policy_size, num_attributes, start, stop)
+    return iter_records(file_name, start, stop)
+
+def scenario_inputs(scenario, file_size, policy_size, num_attributes, start=0, stop=None, cached=None):
+    # every request body is encoded here, before the clock starts
+    file_names = scenario_input_file_names(scenario, file_size, policy_size, num_attributes)
+    payloads = Payloads()
+    credentials = CredentialStore() if credential_store else None
+    if scenario == 'keygen':
+        def user_body(user_meta):
+            # users registered by an earlier run are not registered again but
+            # passed to cached, so they are listed with the new users
+            user = credentials.registered(policy_size, num_attributes, user_meta) if credentials else None
+            if user is not None:
+                if cached:
+                    cached(user)
+                return None
+            return payloads.json({
+                'first_name': user_meta['attributes'][0],
+                'last_name': user_meta['attributes'][1],
+                'attributes': user_meta['attributes'][2:]
+            })
+        return payloads.prepare(lambda: iter_records(file_names[0], start, stop), user_body)
+
+    def users():
+        return scenario_users(file_names[1], policy_size, num_attributes, start, stop)
+    if scenario == 'save':
+        return payloads.prepare(lambda: zip(iter_raw_records(file_names[0], start, stop), users()),
+                                lambda pair: payloads.encounter(*pair), users)
+
+    def private_key(user):
+        # users saved with a credential store are recorded without their keys
+        return credentials.resolve(policy_size, num_attributes, user)['private_key'] if credentials else user['private_key']
+    return payloads.prepare(lambda: ((encounter['encounter_id'], encounter['user']) for encounter in iter_records(file_names[0], start, stop)),
+                            lambda encounter: payloads.json({'private_key': private_key(encounter[1])}))
+
+def storing_users(scenario, policy_size, num_attributes, save_result):
+    # key generation results also go to the credential store
+    if scenario != 'keygen' or not credential_store:
+        return save_result
+    credentials = CredentialStore()
+
+    def save_user(user):
+        credentials.put(policy_size, num_attributes, user)
+        save_result(user)
+    return save_user
+
+scenario_runners = {
+    'keygen': key_generation,
+    'save': save_encounters,
+    'query': query_encounters
+}
+
+scenario_titles = {
+    'keygen': 'Key Generation Test',
+    'save': 'Save Encounter Test',
+    'query': 'Query Encounter Test'
+}
+
+scenario_success_codes = {
+    'keygen': 200,
+    'save': 201,
+    'query': 200
+}
+
+def scenario_output_file_name(scenario, policy_size, num_attributes):
+    if scenario == 'keygen':
+        return users_file_name.format(policy_size, num_attributes)
+    if scenario == 'save':
+        return encounter_ids_file_name
+    return encounters_file_name
+
+def write_test_summary(summary_file_name, scenario, stats, test_start_date, test_end_date, num_threads, num_users, file_size, policy_size, num_attributes, num_shards=None):
+    # api.py serves the summary as soon as it exists, so it only appears complete
+    with atomic_write(summary_file_name) as transaction_times_file:
+        transaction_times_file.write('{} - {} Thread, {} User, {} kb, {} attributes in policy, {} attributes in key\n'.format(
+            scenario_titles[scenario], num_threads, num_users, file_size, policy_size, num_attributes
         ))
-        transaction_times_file.write('Test start: {}\n'.format(test_start_date))
-        transaction_times_file.write('Test end: {}\n'.format(test_end_date))
-        transaction_times_file.write('Total number of transactions: {}\n'.format(num_transactions))
-        transaction_times_file.write('Total time: {}\n'.format(total_time))
-        transaction_times_file.write('Average transaction time: {}\n'.format(avg_txn_time))
-        transaction_times_file.write('Transactions per second: {}\n'.format(rate))
-        transaction_times_file.write('\n')
-        transaction_times_file.writelines(["{}\n".format(txn_time) for txn_time in transaction_times])
+        if num_shards:
+            transaction_times_file.write('Shards: {}\n'.format(num_shards))
+        write_summary(transaction_times_file, stats, test_start_date, test_end_date, scenario_success_codes[scenario])
+
+def new_metrics(run_id, scenario):
+    return MetricsPublisher(app.config['CELERY_RESULT_BACKEND'], run_id, scenario, scenario_success_codes[scenario])
+
+def new_raw_results(name, run_id, scenario, num_threads, file_size, policy_size, num_attributes):
+    return ResultStore(os.path.join(results_dir, 'raw', name), scenario,
+                       dict(run_settings(), run_id=run_id, num_threads=num_threads, file_size=file_size,
+                            policy_size=policy_size, num_attributes=num_attributes))
+
+def run_test(run_id, scenario, summary_file_name, num_threads, num_users, file_size, policy_size, num_attributes):
+    metrics = new_metrics(run_id, scenario)
+    raw_results = new_raw_results(os.path.splitext(os.path.basename(summary_file_name))[0], run_id, scenario,
+                                  num_threads, file_size, policy_size, num_attributes)
+    with atomic_write(scenario_output_file_name(scenario, policy_size, num_attributes), keep_empty=False) as output_file:
+        write_result = lambda result: output_file.write(json.dumps(result) + '\n')
+        inputs = scenario_inputs(scenario, file_size, policy_size, num_attributes, cached=write_result)
+        save_result = storing_users(scenario, policy_size, num_attributes, write_result)
+        test_start_date = datetime.datetime.utcnow()
+        try:
+            stats = scenario_runners[scenario](num_threads, inputs, save_result, metrics, raw_results)
+        except Exception:
+            metrics.close('failed')
+            raw_results.close(state='failed')
+            raise
+        test_end_date = datetime.datetime.utcnow()
+    metrics.close()
+    raw_results.close()
+    print(stats.count(scenario_success_codes[scenario]))
+    write_test_summary(summary_file_name, scenario, stats, test_start_date, test_end_date,
+                       num_threads, num_users, file_size, policy_size, num_attributes)
+
+@celery.task(bind=True)
+def key_generation_test(self, num_threads, num_users, file_size, policy_size, num_attributes):
+    run_test(self.request.id, 'keygen', keygen_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes),
+             num_threads, num_users, file_size, policy_size, num_attributes)
+
+@celery.task(bind=True)
+def save_encounter_test(self, num_threads, num_users, file_size, policy_size, num_attributes):
+    run_test(self.request.id, 'save', save_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes),
+             num_threads, num_users, file_size, policy_size, num_attributes)
+
+@celery.task(bind=True)
+def query_encounter_test(self, num_threads, num_users, file_size, policy_size, num_attributes):
+    run_test(self.request.id, 'query', query_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes),
+             num_threads, num_users, file_size, policy_size, num_attributes)
+
+def without_key(user):
+    # what key generation shards report of a user; the key itself stays in
+    # the credential store
+    return dict((name, value) for name, value in user.items() if name != 'private_key')
 
 @celery.task()
-def query_encounter_test(num_threads, num_users, file_size, policy_size, num_attributes):
-    with open(encounter_ids_file_name, 'r') as encounter_ids_file:
-        encounter_ids = json.load(encounter_ids_file)
-    with open(users_file_name.format(policy_size, num_attributes), 'r') as users_file:
-        users = json.load(users_file)
-
-    transaction_times = []
-    encounters = []
-
-    def query(encounter_id, user):
-        payload = {
-            'private_key': user['private_key']
-        }
-        start = time.time()
-        response = requests.post('{}/encounters/{}'.format(il_upstream_url, encounter_id), headers=headers, auth=auth, json=payload)
-        end = time.time()
-        print(response.status_code)
-        transaction_time = end - start
-        transaction_times.append(transaction_time)
-        encounters.append(response.json())
-
-    pool = ThreadPool(num_users)
-    test_start_date = datetime.datetime.utcnow()
-    for encounter_id, user in zip(encounter_ids, users):
-        pool.apply(query, (encounter_id, user))
-
-    pool.close()
-    pool.join()
-    test_end_date = datetime.datetime.utcnow()
-
-    with open(encounters_file_name, 'w') as encounters_file:
-        print(len(encounters))
-        json.dump(encounters, encounters_file)
-
-    with open(query_file_name.format(num_threads, num_users, file_size, policy_size, num_attributes), 'w') as transaction_times_file:
-        total_time = sum(transaction_times)
-        num_transactions = len(transaction_times)
-        avg_txn_time = total_time/float(num_transactions)
-        rate = 1/avg_txn_time
-        transaction_times_file.write('Query Encounter Test - {} Thread, {} User, {} kb, {} attributes in policy, {} attributes in key\n'.format(
-            num_threads, num_users, file_size, policy_size, num_attributes
-        ))
-        transaction_times_file.write('Test start: {}\n'.format(test_start_date))
-        transaction_times_file.write('Test end: {}\n'.format(test_end_date))
-        transaction_times_file.write('Total number of transactions: {}\n'.format(num_transactions))
-        transaction_times_file.write('Total time: {}\n'.format(total_time))
-        transaction_times_file.write('Average transaction time: {}\n'.format(avg_txn_time))
-        transaction_times_file.write('Transactions per second: {}\n'.format(rate))
-        transaction_times_file.write('\n')
-        transaction_times_file.writelines(["{}\n".format(txn_time) for txn_time in transaction_times])
-
+def test_shard(run_id, scenario, num_threads, file_size, policy_size, num_attributes, start, stop):
+    # runs items [start, stop) of the scenario input and returns its histograms
+    # and results: the encounter IDs it saved, or the users it registered
+    # without their keys, which go to the credential store
+    results = []
+    if scenario == 'keygen':
+        keep = lambda user: results.append(without_key(user))
+    elif scenario == 'save':
+        keep = results.append
+    else:
+        # query results (decrypted encounters) are too large to send back
+        keep = lambda result: None
+    save_result = storing_users(scenario, policy_size, num_attributes, keep)
+    inputs = scenario_inputs(scenario, file_size, policy_size, num_attributes, start, stop, cached=keep)
+    # every shard publishes into the metrics of the whole run; merge_shards
+    # marks it finished
+    metrics = new_metrics(run_id, scenario)
+    raw_results = new_raw_results('{}_shard_{}'.format(run_id, start), run_id, scenario,
+                                  num_threads, file_size, policy_size, num_attributes)
+    test_start = time.time()
+    try:
+        stats = scenario_runners[scenario](num_threads, inputs, save_result, metrics, raw_results)
+    except Exception:
+        metrics.close('failed')
+        raw_results.close(state='failed')
+        raise
+    test_end = time.time()
+    metrics.close(None)
+    raw_results.close()
+    return {
+        'stats': stats.to_dict(),
+        'start': start,
+        'results': results,
+        'test_start': test_start,
+        'test_end': test_end
+    }
 
+@celery.task()
+def merge_shards(shards, run_id, scenario, num_shards, num_threads, num_users, file_size, policy_size, num_attributes):
+    stats = Stats()
+    for shard in shards:
+        stats.merge(Stats.from_dict(shard['stats']))
+    if scenario != 'query':
+        with atomic_write(scenario_output_file_name(scenario, policy_size, num_attributes), keep_empty=False) as output_file:
+            for shard in sorted(shards, key=lambda shard: shard['start']):
+                output_file.writelines(json.dumps(result) + '\n' for result in shard['results'])
+    now = time.time()
+    test_start_date = datetime.datetime.utcfromtimestamp(min([shard['test_start'] for shard in shards] or [now]))
+    test_end_date = datetime.datetime.utcfromtimestamp(max([shard['test_end'] for shard in shards] or [now]))
+    summary_file_name = distributed_file_names[scenario].format(num_shards, num_threads, num_users, file_size, policy_size, num_attributes)
+    write_test_summary(summary_file_name, scenario, stats, test_start_date, test_end_date,
+                       num_threads, num_users, file_size, policy_size, num_attributes, num_shards)
+    set_state(app.config['CELERY_RESULT_BACKEND'], run_id, 'finished')
+
+def scenario_input_count(scenario, file_size, policy_size, num_attributes):
+    # the number of items of the scenario input; with a credential store
+    # save runs take their users from it rather than from the users file
+    file_names = scenario_input_file_names(scenario, file_size, policy_size, num_attributes)
+    if scenario == 'save' and credential_store:
+        return min(count_records(file_names[0]), CredentialStore().count(policy_size, num_attributes))
+    return min(count_records(file_name) for file_name in file_names)
+
+@celery.task(bind=True)
+def distributed_test(self, scenario, num_shards, num_threads, num_users, file_size, policy_size, num_attributes):
+    if scenario == 'keygen' and not credential_store:
+        # the private keys would otherwise have to come back through the broker
+        raise ValueError('distributed key generation needs CREDENTIAL_STORE on storage shared by the workers')
+    num_items = scenario_input_count(scenario, file_size, policy_size, num_attributes)
+    merge = merge_shards.s(self.request.id, scenario, num_shards, num_threads, num_users, file_size, policy_size, num_attributes)
+    # this task only dispatches the shards; the ID of the merge task it returns
+    # is what api.py follows for the state of the run
+    if not num_items:
+        # nothing to shard; the summary still records the empty run
+        return merge.delay([]).id
+    shard_size = -(-num_items // num_shards)
+    shards = [test_shard.s(self.request.id, scenario, num_threads, file_size, policy_size, num_attributes, start, start + shard_size)
+              for start in range(0, num_items, shard_size)]
+    return chord(shards)(merge).id
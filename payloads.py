@@ -0,0 +1,177 @@
+# Request bodies, encoded before the clock starts and sent as is. The raw
+# encounter record is never decoded: policy and user_id are spliced onto the
+# end of its JSON text, so they override any stale values. Every body is
+# encoded once per item and reused for its retries, while the rest of an item
+# is streamed from its input whenever it is sent (see Prepared).
+# PAYLOAD_ENCODING selects the body sent for encounters:
+#   json - the spliced JSON text as is
+#   gzip, zstd - the JSON text compressed, with a Content-Encoding header
+#   multipart - the image as a binary part next to the rest of the encounter
+import json
+import gzip
+import mmap
+import time
+import uuid
+import base64
+import hashlib
+import tempfile
+
+from array import array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from config import *
+from histogram import Histogram
+
+ENCODINGS = ('json', 'gzip', 'zstd', 'multipart')
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def splice_encounter(record, user):
+    fields = json.dumps({'policy': user['policy'], 'user_id': user['user_id']}).encode('utf-8')
+    record = record.rstrip()[:-1].rstrip()
+    separator = b'' if record.endswith(b'{') else b', '
+    return record + separator + fields[1:]
+
+def encode_multipart(document, boundary=None):
+    encounter = json.loads(document.decode('utf-8'))
+    image = encounter.pop('image', None)
+    boundary = boundary or uuid.uuid4().hex
+    parts = [('encounter', 'application/json', json.dumps(encounter).encode('utf-8'))]
+    if image is not None:
+        parts.append(('image', 'application/octet-stream', base64.b64decode(image)))
+    body = b''.join(
+        '--{}\r\nContent-Disposition: form-data; name="{}"\r\nContent-Type: {}\r\n\r\n'.format(boundary, name, content_type).encode('utf-8') + content + b'\r\n'
+        for name, content_type, content in parts
+    ) + '--{}--\r\n'.format(boundary).encode('utf-8')
+    return body, {'Content-Type': 'multipart/form-data; boundary={}'.format(boundary)}
+
+def encode(document, encoding=None, boundary=None):
+    encoding = encoding or payload_encoding
+    if encoding == 'json':
+        return document, JSON_HEADERS
+    if encoding == 'gzip':
+        return gzip.compress(document, payload_compression_level), {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ImportError('PAYLOAD_ENCODING=zstd needs the zstandard package')
+        return zstandard.ZstdCompressor(level=payload_compression_level).compress(document), {'Content-Type': 'application/json', 'Content-Encoding': 'zstd'}
+    if encoding == 'multipart':
+        return encode_multipart(document, boundary)
+    raise ValueError('unknown payload encoding {}'.format(encoding))
+
+class BodyStore(object):
+    # bodies are appended to an unlinked spool file and sent as views of one
+    # memory map of it, so they are paged by the OS rather than held as Python
+    # objects; identical bodies are stored once and shared
+    def __init__(self):
+        self.spool = tempfile.TemporaryFile()
+        self.offsets = array('Q')
+        self.shared = {}
+        self.size = 0
+        self.buffer = None
+
+    def add(self, body):
+        if self.buffer is not None:
+            raise ValueError('bodies cannot be added once they are being sent')
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        index = self.shared.get(digest)
+        if index is None:
+            index = len(self.offsets) // 2
+            self.spool.write(body)
+            self.offsets.extend((self.size, len(body)))
+            self.size += len(body)
+            self.shared[digest] = index
+        return index
+
+    def get(self, index):
+        if self.buffer is None:
+            self.spool.flush()
+            self.buffer = memoryview(mmap.mmap(self.spool.fileno(), 0, access=mmap.ACCESS_READ)) if self.size else memoryview(b'')
+            # nothing is added from here on, so the digests can go
+            self.shared = None
+        start = self.offsets[2 * index]
+        return self.buffer[start:start + self.offsets[2 * index + 1]]
+
+class Payloads(object):
+    def __init__(self, encoding=None):
+        self.encoding = encoding or payload_encoding
+        # one multipart boundary per run, so identical encounters share a body
+        self.boundary = uuid.uuid4().hex
+        self.bodies = BodyStore()
+        self.encodings = set()
+        self.serialization = Histogram()
+        self.count = 0
+        self.json_bytes = 0
+        self.body_bytes = 0
+
+    def encoded(self, document, encoding, start):
+        body, body_headers = encode(document, encoding, self.boundary)
+        self.serialization.record(time.perf_counter() - start)
+        self.encodings.add(encoding)
+        self.count += 1
+        self.json_bytes += len(document)
+        self.body_bytes += len(body)
+        return body, body_headers
+
+    def json(self, document):
+        start = time.perf_counter()
+        return self.encoded(json.dumps(document).encode('utf-8'), 'json', start)
+
+    def encounter(self, record, user):
+        start = time.perf_counter()
+        return self.encoded(splice_encounter(record, user), self.encoding, start)
+
+    def prepare(self, records, build, metas=None):
+        # records and metas are callables returning a fresh iterator over the
+        # input (metas defaults to records); build(record) returns the
+        # (body, body_headers) of a record, or None to leave it out. Call it
+        # before the timed region: only the bodies are encoded and stored here
+        prepared = Prepared(self.bodies, metas or records)
+        for position, record in enumerate(records()):
+            built = build(record)
+            if built is not None:
+                prepared.add(position, self.bodies.add(built[0]), built[1])
+        return prepared
+
+class Prepared(object):
+    # the prepared items of one input. Per item only its position in the
+    # input and the indexes of its body and headers are kept; every pass
+    # streams the metadata from the input again and yields
+    # ((body, body_headers), meta) items, so an input can be cycled without
+    # holding its records
+    def __init__(self, bodies, metas):
+        self.bodies = bodies
+        self.metas = metas
+        self.positions = array('Q')
+        self.indexes = array('Q')
+        self.header_indexes = array('I')
+        self.headers = []
+        self.shared_headers = {}
+
+    def add(self, position, index, body_headers):
+        key = tuple(sorted(body_headers.items()))
+        if key not in self.shared_headers:
+            self.shared_headers[key] = len(self.headers)
+            self.headers.append(body_headers)
+        self.positions.append(position)
+        self.indexes.append(index)
+        self.header_indexes.append(self.shared_headers[key])
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        if not self.positions:
+            return
+        item = 0
+        for position, meta in enumerate(self.metas()):
+            if position != self.positions[item]:
+                continue
+            yield (self.bodies.get(self.indexes[item]), self.headers[self.header_indexes[item]]), meta
+            item += 1
+            if item == len(self.positions):
+                return
@@ -0,0 +1,147 @@
+# Keygen -> save -> query pipeline. Each stage has its own worker threads and
+# hands successful items to the next stage through a bounded queue, so all
+# three stages run at once and a slow stage applies backpressure upstream.
+# Request bodies are encoded by Payloads before each transaction is timed; the
+# encounter records are raw JSON text, as for save_encounter_test.py.
+import time
+import queue
+import threading
+import requests
+
+from config import *
+from histogram import Histogram, Stats
+from payloads import Payloads
+
+import client
+
+STOP = object()
+
+stages = ('keygen', 'save', 'query')
+
+stage_success_codes = {
+    'keygen': 200,
+    'save': 201,
+    'query': 200
+}
+
+class Pipeline(object):
+    def __init__(self, num_threads=1, queue_size=100, raw_results=None):
+        self.num_threads = num_threads
+        self.queues = {'save': queue.Queue(queue_size), 'query': queue.Queue(queue_size)}
+        self.stats = {stage: Stats() for stage in stages}
+        # time an item waited in the queue in front of the stage
+        self.handoff = {'save': Histogram(), 'query': Histogram()}
+        self.payloads = Payloads()
+        self.raw_results = raw_results
+        self.errors = []
+        self.lock = threading.Lock()
+        self.payload_lock = threading.Lock()
+
+    def record(self, stage, status_code, transaction_time, num_bytes):
+        with self.lock:
+            self.stats[stage].record(status_code, transaction_time)
+        if self.raw_results:
+            self.raw_results.record(status_code, transaction_time, num_bytes, scenario=stage)
+
+    def hand_off(self, stage, item):
+        self.queues[stage].put((time.time(), item))
+
+    def take(self, stage):
+        queued, item = self.queues[stage].get()
+        if item is not STOP:
+            with self.lock:
+                self.handoff[stage].record(time.time() - queued)
+        return item
+
+    def body(self, encode, *args):
+        with self.payload_lock:
+            return encode(*args)
+
+    def post(self, stage, path, prepared, result=None):
+        # returns result(contents) of a successful transaction, or True when
+        # there is no result; connection errors and responses that cannot be
+        # decoded are recorded as status 0, so a worker never dies with items
+        # still queued in front of it
+        body, body_headers = prepared
+        start = time.time()
+        try:
+            response = client.post(path, data=body, headers=body_headers)
+            status_code = response.status_code
+            value = (result(response.json()) if result else True) if status_code == stage_success_codes[stage] else None
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            status_code, value = 0, None
+        end = time.time()
+        self.record(stage, status_code, end - start, len(body))
+        return value
+
+    def save_user(self, user_meta, encounter):
+        prepared = self.body(self.payloads.json, {'attributes': user_meta['attributes']})
+        user = self.post('keygen', '/user', prepared, lambda contents: {
+            'user_id': contents['user_id'],
+            'private_key': contents['private_key'],
+            'policy': user_meta['policy'],
+            'attributes': user_meta['attributes']
+        })
+        if user is not None:
+            self.hand_off('save', (encounter, user))
+
+    def save(self, encounter, user):
+        prepared = self.body(self.payloads.encounter, encounter, user)
+        encounter_id = self.post('save', '/encounters/', prepared, lambda contents: contents['encounter_id'])
+        if encounter_id is not None:
+            self.hand_off('query', (encounter_id, user))
+
+    def query(self, encounter_id, user):
+        prepared = self.body(self.payloads.json, {'private_key': user['private_key']})
+        self.post('query', '/encounters/{}'.format(encounter_id), prepared)
+
+    def keygen_worker(self, inputs):
+        while True:
+            with self.lock:
+                item = next(inputs, None)
+            if item is None:
+                return
+            user_meta, encounter = item
+            self.save_user(user_meta, encounter)
+
+    def save_worker(self):
+        for encounter, user in iter(lambda: self.take('save'), STOP):
+            self.save(encounter, user)
+
+    def query_worker(self):
+        for encounter_id, user in iter(lambda: self.take('query'), STOP):
+            self.query(encounter_id, user)
+
+    def work(self, target, stage, *args):
+        # a worker that fails keeps emptying the queue in front of it, so the
+        # stages upstream never block on it; the error is kept in errors
+        try:
+            target(*args)
+        except Exception as error:
+            with self.lock:
+                self.errors.append(error)
+            if stage in self.queues:
+                for _ in iter(lambda: self.take(stage), STOP):
+                    pass
+
+    def start_stage(self, target, stage, *args):
+        threads = [threading.Thread(target=self.work, args=(target, stage) + args) for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def stop_stage(self, threads, next_stage=None):
+        for thread in threads:
+            thread.join()
+        if next_stage:
+            for _ in range(self.num_threads):
+                self.hand_off(next_stage, STOP)
+
+    def run(self, users_meta, encounters):
+        # encounters are raw records (datasets.iter_raw_records)
+        keygen_threads = self.start_stage(self.keygen_worker, 'keygen', zip(users_meta, encounters))
+        save_threads = self.start_stage(self.save_worker, 'save')
+        query_threads = self.start_stage(self.query_worker, 'query')
+        self.stop_stage(keygen_threads, 'save')
+        self.stop_stage(save_threads, 'query')
+        self.stop_stage(query_threads)
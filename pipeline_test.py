@@ -0,0 +1,64 @@
+# USAGE:
+# docker exec abeinpos_abe-in-pos_1 python3 pipeline_test.py <policy_size> <num_attributes> <num_txns>_encounters.jsonl
+# Users from 'run <num_txns> <policy_size> <num_attributes>.json' go through
+# key generation, save and query concurrently, one encounter per user.
+# Raw results go to data/raw/<summary name>, one row per transaction with the
+# stage as its scenario.
+import sys
+import os
+import warnings
+import datetime
+
+from config import *
+from report import write_summary, write_latencies, write_payload_summary, summary_suffix
+from datasets import iter_records, iter_raw_records
+from resultstore import ResultStore, run_settings
+from pipeline import Pipeline, stages, stage_success_codes
+
+test_data_dir = 'input'
+output_data_dir = 'data'
+
+policy_size = int(sys.argv[1])
+num_attributes = int(sys.argv[2])
+input_filename = sys.argv[3]
+
+num_txns_str = input_filename.split("_")[0]
+
+test_users_file_name = 'run {} {} {}.json'.format(num_txns_str, policy_size, num_attributes)
+transaction_summary_file_name = '{}_{}_{}_pipeline_transaction_summary{}.txt'.format(policy_size, num_attributes, num_txns_str, summary_suffix())
+
+test_users_path = os.path.join(test_data_dir, test_users_file_name)
+input_path = os.path.join(test_data_dir, input_filename)
+transaction_summary_path = os.path.join(output_data_dir, transaction_summary_file_name)
+raw_results_path = os.path.join(output_data_dir, 'raw', os.path.splitext(transaction_summary_file_name)[0])
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    raw_results = ResultStore(raw_results_path, 'pipeline', dict(run_settings(), policy_size=policy_size, num_attributes=num_attributes, input=input_filename,
+                                                                 pipeline_threads=pipeline_threads, pipeline_queue_size=pipeline_queue_size))
+    pipeline = Pipeline(pipeline_threads, pipeline_queue_size, raw_results)
+    test_start_date = datetime.datetime.utcnow()
+    pipeline.run(iter_records(test_users_path), iter_raw_records(input_path))
+    test_end_date = datetime.datetime.utcnow()
+
+raw_results.close()
+
+print("number of encounters: {}".format(pipeline.stats['query'].count(200)))
+
+with open(transaction_summary_path, "w") as transaction_summary_file:
+    transaction_summary_file.write('Connection mode: {}\n'.format(connection_mode))
+    transaction_summary_file.write('Threads per stage: {}\n'.format(pipeline_threads))
+    transaction_summary_file.write('Queue size: {}\n'.format(pipeline_queue_size))
+    if pipeline.errors:
+        transaction_summary_file.write('Worker errors: {} (first: {!r})\n'.format(len(pipeline.errors), pipeline.errors[0]))
+    for stage in stages:
+        transaction_summary_file.write('\n[{}]\n'.format(stage))
+        write_summary(transaction_summary_file, pipeline.stats[stage], test_start_date, test_end_date, stage_success_codes[stage])
+        if stage in pipeline.handoff:
+            transaction_summary_file.write('\n')
+            write_latencies(transaction_summary_file, ' (handoff)', pipeline.handoff[stage])
+    transaction_summary_file.write('\n')
+    write_payload_summary(transaction_summary_file, pipeline.payloads)
+
+if pipeline.errors:
+    raise pipeline.errors[0]
@@ -0,0 +1,151 @@
+# Seeded generator of ABE users: a policy expression over policy_size
+# attributes and a key with num_attributes attributes, in the format of
+# test_data/users_*.json. Attribute names are spreadsheet-style (A..Z, AA..)
+# drawn from a vocabulary of POLICY_VOCABULARY names. To stream millions of
+# records, nothing is decided per record that can be decided up front: policy
+# trees are built once as templates with numbered leaf slots, together with
+# the slots a key holds to satisfy them or not, and each record takes its
+# names from a rotation of one of a fixed set of vocabulary permutations.
+# Shapes:
+#   and, or - binary trees of a single gate
+#   mixed - binary trees of random and/or gates (like the sample data)
+#   threshold - trees of 'k of (...)' gates with up to POLICY_FANOUT children
+# POLICY_SATISFYING is the fraction of keys that satisfy their own policy, i.e.
+# of queries that should decrypt.
+import random
+import string
+import operator
+import itertools
+
+from config import *
+
+SHAPES = ('and', 'or', 'mixed', 'threshold')
+
+def attribute_names(size):
+    names = []
+    for length in itertools.count(1):
+        for letters in itertools.product(string.ascii_uppercase, repeat=length):
+            if len(names) == size:
+                return names
+            names.append(''.join(letters))
+
+def split(leaves, parts, rng):
+    # sizes of parts non-empty subtrees holding leaves leaves in total
+    cuts = sorted(rng.sample(range(1, leaves), parts - 1))
+    return [end - start for start, end in zip([0] + cuts, cuts + [leaves])]
+
+def picker(slots):
+    # names -> tuple of the names in slots
+    if len(slots) > 1:
+        return operator.itemgetter(*slots)
+    return lambda names: tuple(names[slot] for slot in slots)
+
+class Template(object):
+    def __init__(self, policy_size, shape, rng, fanout=None):
+        self.shape = shape
+        self.fanout = fanout or policy_fanout
+        self.slots = itertools.count()
+        self.tree = self.build(policy_size, rng)
+        self.format = self.render(self.tree)
+
+    def build(self, leaves, rng):
+        if leaves == 1:
+            return ('leaf', next(self.slots))
+        if self.shape == 'threshold':
+            parts = min(leaves, rng.randint(2, max(2, self.fanout)))
+            children = [self.build(size, rng) for size in split(leaves, parts, rng)]
+            return ('threshold', rng.randint(1, parts), children)
+        gate = self.shape if self.shape in ('and', 'or') else rng.choice(('and', 'or'))
+        return (gate, None, [self.build(size, rng) for size in split(leaves, 2, rng)])
+
+    def render(self, node):
+        if node[0] == 'leaf':
+            return '%s'
+        gate, threshold, children = node
+        if gate == 'threshold':
+            return '({} of ({}))'.format(threshold, ', '.join(self.render(child) for child in children))
+        return '(' + ' {} '.format(gate).join(self.render(child) for child in children) + ')'
+
+    def satisfying(self, node, rng):
+        # a minimal set of slots that satisfies the subtree
+        if node[0] == 'leaf':
+            return {node[1]}
+        gate, threshold, children = node
+        needed = len(children) if gate == 'and' else 1 if gate == 'or' else threshold
+        return set().union(*[self.satisfying(child, rng) for child in rng.sample(children, needed)])
+
+    def falsifying(self, node, rng):
+        # a set of slots whose absence falsifies the subtree
+        if node[0] == 'leaf':
+            return {node[1]}
+        gate, threshold, children = node
+        needed = 1 if gate == 'and' else len(children) if gate == 'or' else len(children) - threshold + 1
+        return set().union(*[self.falsifying(child, rng) for child in rng.sample(children, needed)])
+
+class PolicyGenerator(object):
+    def __init__(self, policy_size, num_attributes, shape=None, vocabulary=None, satisfying=None,
+                 seed=None, num_templates=None, variants=4, permutations=1024):
+        self.policy_size = policy_size
+        self.num_attributes = num_attributes
+        self.shape = shape or policy_shape
+        self.vocabulary = attribute_names(vocabulary or policy_vocabulary)
+        self.satisfying_fraction = policy_satisfying if satisfying is None else satisfying
+        self.rng = random.Random(policy_seed if seed is None else seed)
+        size = len(self.vocabulary)
+        if self.shape not in SHAPES:
+            raise ValueError('unknown policy shape {}'.format(self.shape))
+        if policy_size > size or num_attributes > size:
+            raise ValueError('the vocabulary has only {} attributes'.format(size))
+        # slots are numbered in rendering order, so names[slot] fills the
+        # slot-th '%s' of the template. Each key variant is the slots a key
+        # holds and, in order, the other policy slots it may also hold
+        slots = set(range(policy_size))
+        self.templates = []
+        for _ in range(num_templates or policy_templates):
+            template = Template(policy_size, self.shape, self.rng)
+            template.satisfying_keys = []
+            template.failing_keys = []
+            for _ in range(variants):
+                held = template.satisfying(template.tree, self.rng)
+                if self.satisfying_fraction > 0 and len(held) > num_attributes:
+                    raise ValueError('{} attributes cannot satisfy {} policies of {} attributes'.format(num_attributes, self.shape, policy_size))
+                template.satisfying_keys.append((picker(sorted(held)), picker(sorted(slots - held))))
+                # a failing key may hold any policy attribute outside a
+                # falsifying set; it holds a random number of them
+                allowed = slots - template.falsifying(template.tree, self.rng)
+                if self.satisfying_fraction < 1 and len(allowed) + size - policy_size < num_attributes:
+                    raise ValueError('the vocabulary is too small for keys that do not satisfy {} policies'.format(self.shape))
+                held = set(self.rng.sample(sorted(allowed), self.rng.randint(0, min(len(allowed), num_attributes))))
+                template.failing_keys.append((picker(sorted(held)), picker(sorted(allowed - held))))
+            self.templates.append(template)
+        self.permutations = []
+        for _ in range(permutations):
+            permutation = self.rng.sample(self.vocabulary, size)
+            self.permutations.append(permutation + permutation)
+
+    def record(self):
+        rng = self.rng
+        size = len(self.vocabulary)
+        template = rng.choice(self.templates)
+        permutation = rng.choice(self.permutations)
+        offset = rng.randrange(size)
+        names = permutation[offset:offset + self.policy_size]
+        policy = template.format % tuple(names)
+        keys = template.satisfying_keys if rng.random() < self.satisfying_fraction else template.failing_keys
+        held, rest = rng.choice(keys)
+        attributes = list(held(names))
+        # the rest of the key comes from outside the policy, and only when
+        # that runs out from the policy attributes the key may also hold
+        missing = self.num_attributes - len(attributes)
+        outside = permutation[offset + self.policy_size:offset + size]
+        if missing <= len(outside):
+            return policy, attributes + outside[:missing]
+        return policy, attributes + outside + list(rest(names))[:missing - len(outside)]
+
+    def lines(self, count=None):
+        # JSON Lines text; the names need no escaping, so lines are built
+        # directly instead of through json.dumps
+        records = itertools.repeat(None) if count is None else itertools.repeat(None, count)
+        for _ in records:
+            policy, attributes = self.record()
+            yield '{"policy": "' + policy + '", "attributes": ["' + '", "'.join(attributes) + '"]}\n'
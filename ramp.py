@@ -0,0 +1,118 @@
+# Closed-loop concurrency ramp. Starting at RAMP_START workers, every step
+# runs the loadgen.py closed-loop engine over the prepared items, cycled, and
+# counts completed transactions in RAMP_WINDOW second windows (soak.py). A step
+# holds until the last RAMP_STABLE_WINDOWS windows agree on throughput and p99
+# within RAMP_TOLERANCE (relative spread), or for at most RAMP_MAX_WINDOWS
+# windows, and is summarized over those last windows. The concurrency is then
+# multiplied by RAMP_FACTOR, until a step's p99 exceeds RAMP_MAX_P99, its error
+# rate exceeds RAMP_MAX_ERROR_RATE, it does not settle or RAMP_MAX is passed.
+# The highest stable step within both limits is the maximum sustainable
+# concurrency.
+import time
+
+from config import *
+from histogram import Stats
+from soak import WindowSeries, cycle
+
+import loadgen
+
+STEP_COLUMNS = ('concurrency', 'transactions', 'throughput', 'mean', 'p50', 'p90', 'p99', 'error_rate', 'windows', 'stable', 'passed')
+
+def spread(values):
+    mean = sum(values) / float(len(values))
+    return (max(values) - min(values)) / mean if mean else 0.0
+
+class Ramp(object):
+    def __init__(self, scenario, items, success_code, on_result=None):
+        if not items:
+            raise ValueError('a ramp needs at least one item')
+        self.scenario = scenario
+        self.items = items
+        self.success_code = success_code
+        self.on_result = on_result
+        self.steps = []
+
+    def settled(self, series):
+        # the last windows once they agree, or once the step has held for
+        # RAMP_MAX_WINDOWS windows; None while the step should go on
+        windows = int((time.monotonic() - series.started) / series.window)
+        if windows < ramp_stable_windows:
+            return None
+        rows = [row for row in series.rows() if row['duration'] >= series.window][-ramp_stable_windows:]
+        if len(rows) == ramp_stable_windows and all(row['transactions'] for row in rows):
+            if spread([row['throughput'] for row in rows]) <= ramp_tolerance and spread([row['p99'] for row in rows]) <= ramp_tolerance:
+                return rows, True
+        if windows >= ramp_max_windows:
+            return rows, False
+        return None
+
+    def step_items(self, series, step):
+        checked = 0
+        for item in cycle(self.items):
+            windows = int((time.monotonic() - series.started) / series.window)
+            if windows != checked:
+                checked = windows
+                step['settled'] = self.settled(series)
+                if step['settled']:
+                    return
+            yield item
+
+    def run_step(self, concurrency):
+        series = WindowSeries(self.success_code, ramp_window)
+        step = {'settled': None}
+
+        def record(item, status_code, contents, latency):
+            series.record(status_code, latency)
+            if self.on_result:
+                self.on_result(item, status_code, contents, latency)
+
+        # always closed loop, whatever ARRIVAL_RATE is set to
+        loadgen.complete(loadgen.run_closed_loop(self.scenario, self.step_items(series, step), record, concurrency))
+        series.close()
+        rows, stable = step['settled']
+        stats = Stats()
+        for row in rows:
+            stats.merge(series.stats(int(round(row['window_start'] / series.window))))
+        transactions = stats.count()
+        result = {
+            'concurrency': concurrency,
+            'transactions': transactions,
+            'throughput': sum(row['throughput'] for row in rows) / len(rows) if rows else 0.0,
+            'mean': stats.latency.mean(),
+            'p50': stats.latency.percentile(50),
+            'p90': stats.latency.percentile(90),
+            'p99': stats.latency.percentile(99),
+            'error_rate': 1 - stats.count(self.success_code) / float(transactions) if transactions else 1.0,
+            'windows': len(series.windows),
+            'stable': stable
+        }
+        # a step that never settled is not sustained, whatever its p99
+        result['passed'] = stable and result['p99'] <= ramp_max_p99 and result['error_rate'] <= ramp_max_error_rate
+        return result
+
+    def run(self):
+        concurrency = ramp_start
+        while concurrency <= ramp_max:
+            step = self.run_step(concurrency)
+            self.steps.append(step)
+            print('concurrency {concurrency}: {throughput:.1f}/s, p99 {p99}, error rate {error_rate:.3f}{0}'.format(
+                '' if step['stable'] else ' (not stable)', **step))
+            if not step['passed']:
+                break
+            concurrency = max(concurrency + 1, int(round(concurrency * ramp_factor)))
+        return self.steps
+
+    def max_concurrency(self):
+        # the highest stable step within the limits, or None
+        passed = [step for step in self.steps if step['passed']]
+        return passed[-1] if passed else None
+
+    def stop_reason(self):
+        if not self.steps or self.steps[-1]['passed']:
+            return 'RAMP_MAX'
+        step = self.steps[-1]
+        if step['p99'] > ramp_max_p99:
+            return 'p99'
+        if step['error_rate'] > ramp_max_error_rate:
+            return 'error rate'
+        return 'not stable'
@@ -0,0 +1,118 @@
+# USAGE:
+# docker exec abeinpos_abe-in-pos_1 python3 ramp_test.py <ramp_spec>.json
+# Steps the concurrency of save and query up until the IL saturates (see
+# ramp.py), for every policy_size/num_attributes/kb combination in the spec.
+# Example spec:
+# {
+#     "scenarios": ["save", "query"],
+#     "policy_size": [64, 128],
+#     "num_attributes": [64, 128],
+#     "num_txns": 100,
+#     "kb": [8, 128, 1024]
+# }
+# Save ramps cycle through input/<num_txns>_encounters_<kb>kb.jsonl with the
+# users of input/users_<policy_size>_<num_attributes>_<num_txns>.jsonl (or the
+# credential store). Query ramps cycle through the last <num_txns> encounters
+# the save ramp saved, or without a save ramp through
+# input/<num_txns>_encounter_ids_<policy_size>_<num_attributes>.jsonl.
+# data/<spec>_ramp.csv gets the throughput and latency of every step and
+# data/<spec>_max_concurrency.csv the highest stable step within the limits. A ramp
+# without items, e.g. a query ramp after a save ramp that saved nothing, is
+# skipped and listed with max_concurrency 0, stopped_by 'no items'.
+import sys
+import os
+import csv
+import json
+import warnings
+import itertools
+import collections
+
+from config import *
+from datasets import iter_records, iter_raw_records
+from payloads import Payloads
+from credentials import CredentialStore
+from ramp import Ramp, STEP_COLUMNS
+
+import scenarios
+
+test_data_dir = 'input'
+output_data_dir = 'data'
+
+spec_path = sys.argv[1]
+with open(spec_path) as spec_file:
+    spec = json.load(spec_file)
+
+spec_name = os.path.splitext(os.path.basename(spec_path))[0]
+curve_path = os.path.join(output_data_dir, '{}_ramp.csv'.format(spec_name))
+max_concurrency_path = os.path.join(output_data_dir, '{}_max_concurrency.csv'.format(spec_name))
+
+num_txns = spec['num_txns']
+dimensions = ('scenario', 'policy_size', 'num_attributes', 'kb')
+credentials = CredentialStore() if credential_store else None
+
+def users(policy_size, num_attributes):
+    if credentials:
+        return credentials.users(policy_size, num_attributes)
+    return iter_records(os.path.join(test_data_dir, 'users_{}_{}_{}.jsonl'.format(policy_size, num_attributes, num_txns)))
+
+def private_key(policy_size, num_attributes, user):
+    return credentials.resolve(policy_size, num_attributes, user)['private_key'] if credentials else user['private_key']
+
+def save_items(payloads, policy_size, num_attributes, kb):
+    encounters_path = os.path.join(test_data_dir, '{}_encounters_{}kb.jsonl'.format(num_txns, kb))
+    return payloads.prepare(lambda: zip(iter_raw_records(encounters_path), users(policy_size, num_attributes)),
+                            lambda pair: payloads.encounter(*pair), lambda: users(policy_size, num_attributes))
+
+def query_items(payloads, policy_size, num_attributes, saved):
+    def encounters():
+        if saved is not None:
+            return iter(saved)
+        encounter_ids_path = os.path.join(test_data_dir, '{}_encounter_ids_{}_{}.jsonl'.format(num_txns, policy_size, num_attributes))
+        return ((encounter['encounter_id'], encounter['user']) for encounter in iter_records(encounter_ids_path))
+    return payloads.prepare(encounters, lambda encounter: payloads.json({'private_key': private_key(policy_size, num_attributes, encounter[1])}))
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+curve = []
+maxima = []
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    for policy_size, num_attributes, kb in itertools.product(spec['policy_size'], spec['num_attributes'], spec['kb']):
+        saved = None
+        for scenario in ('save', 'query'):
+            if scenario not in spec['scenarios']:
+                continue
+            run = {'scenario': scenario, 'policy_size': policy_size, 'num_attributes': num_attributes, 'kb': kb}
+            print('ramping {scenario} {policy_size} {num_attributes} {kb}kb'.format(**run))
+            payloads = Payloads()
+            if scenario == 'save':
+                saved = collections.deque(maxlen=num_txns)
+
+                def collect(item, status_code, contents, latency):
+                    if status_code == 201:
+                        saved.append((contents['encounter_id'], item[1]))
+
+                items, on_result = save_items(payloads, policy_size, num_attributes, kb), collect
+            else:
+                items, on_result = query_items(payloads, policy_size, num_attributes, saved), None
+            if not items:
+                # e.g. a query ramp after a save ramp that saved nothing
+                print('skipped: no {} items'.format(scenario))
+                maxima.append(dict(run, max_concurrency=0, stopped_by='no items'))
+            else:
+                ramp = Ramp(getattr(scenarios, scenario), items, 201 if scenario == 'save' else 200, on_result)
+                ramp.run()
+                curve.extend(dict(step, **run) for step in ramp.steps)
+                best = ramp.max_concurrency() or {}
+                maxima.append(dict(run, max_concurrency=best.get('concurrency', 0), throughput=best.get('throughput', ''),
+                                   p99=best.get('p99', ''), error_rate=best.get('error_rate', ''), stopped_by=ramp.stop_reason()))
+            # rewritten after every ramp so an interrupted spec keeps its results
+            write_csv(curve_path, dimensions + STEP_COLUMNS, curve)
+            write_csv(max_concurrency_path, dimensions + ('max_concurrency', 'throughput', 'p99', 'error_rate', 'stopped_by'), maxima)
+
+print('curve: {}'.format(curve_path))
+print('max concurrency: {}'.format(max_concurrency_path))
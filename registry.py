@@ -0,0 +1,64 @@
+# Registry of test runs keyed on the full parameter tuple. Starting a run
+# claims its key in Redis with SET NX, so repeated requests while it is in
+# flight return the same task instead of enqueueing duplicates. Finished
+# summaries are served from an in-memory LRU instead of being re-read from disk.
+import os
+import uuid
+import threading
+
+from collections import OrderedDict
+
+from config import *
+
+run_key_prefix = 'run:'
+
+class LRUCache(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+class RunRegistry(object):
+    def __init__(self, redis_client, cache_size=None, ttl=None):
+        self.redis = redis_client
+        self.results = LRUCache(cache_size or registry_cache_size)
+        self.ttl = ttl or registry_ttl
+
+    def run_key(self, scenario, *params):
+        return run_key_prefix + ':'.join(str(param) for param in (scenario,) + params)
+
+    def result(self, run_key, summary_file_name):
+        contents = self.results.get(run_key)
+        if contents is None and os.path.exists(summary_file_name):
+            with open(summary_file_name, 'rb') as summary_file:
+                contents = summary_file.read()
+            self.results.put(run_key, contents)
+            self.redis.delete(run_key)
+        return contents
+
+    def claim(self, run_key):
+        # returns (task_id, True) if the caller must start the run under task_id
+        task_id = str(uuid.uuid4())
+        if self.redis.set(run_key, task_id, nx=True, ex=self.ttl):
+            return task_id, True
+        existing = self.redis.get(run_key)
+        if existing is None:
+            return self.claim(run_key)
+        return existing.decode('utf-8'), False
+
+    def release(self, run_key):
+        self.redis.delete(run_key)
@@ -0,0 +1,121 @@
+import os
+import uuid
+import contextlib
+
+from config import *
+from balancer import upstreams
+from transport import PHASES
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+@contextlib.contextmanager
+def atomic_write(path, keep_empty=True):
+    # writes a temporary file next to path and renames it over path once it is
+    # complete, so nothing reads a half written file and a failed run leaves
+    # the previous one in place; with keep_empty=False a run that wrote
+    # nothing (every transaction failed) also leaves it in place
+    temp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    try:
+        with open(temp_path, 'w') as output_file:
+            yield output_file
+            written = output_file.tell()
+        if written or keep_empty or not os.path.exists(path):
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def summary_suffix(label=None):
+    suffix = '_cold' if connection_mode == 'cold' else ''
+    label = run_label if label is None else label
+    if label:
+        suffix += '_' + label
+    return suffix
+
+def write_settings(summary_file):
+    summary_file.write('Connection mode: {}\n'.format(connection_mode))
+    if arrival_rate:
+        summary_file.write('Arrival rate: {} ({})\n'.format(arrival_rate, arrival_process))
+    else:
+        summary_file.write('Concurrency: {}\n'.format(concurrency))
+    if len(upstreams.urls) > 1:
+        summary_file.write('Load balancing: {}\n'.format(upstreams.policy))
+        for url in upstreams.urls:
+            summary_file.write('Requests to {}: {}\n'.format(url, upstreams.sent[url]))
+
+def write_latencies(summary_file, label, histogram):
+    summary_file.write('Mean latency{}: {}\n'.format(label, histogram.mean()))
+    for percentile in PERCENTILES:
+        summary_file.write('p{} latency{}: {}\n'.format(percentile, label, histogram.percentile(percentile)))
+    summary_file.write('Max latency{}: {}\n'.format(label, histogram.max or 0.0))
+
+def write_status_table(summary_file, stats):
+    summary_file.write('Status code, transactions, mean, {}, max\n'.format(', '.join('p{}'.format(percentile) for percentile in PERCENTILES)))
+    for status_code, histogram in sorted(stats.by_status.items()):
+        summary_file.write('{}, {}, {}, {}, {}\n'.format(
+            status_code, histogram.count, histogram.mean(),
+            ', '.join(str(histogram.percentile(percentile)) for percentile in PERCENTILES),
+            histogram.max
+        ))
+
+def write_summary(summary_file, stats, test_start_date, test_end_date, success_code):
+    wall_time = (test_end_date - test_start_date).total_seconds()
+    num_transactions = stats.count()
+    successful_transactions = stats.count(success_code)
+    summary_file.write('Test start: {}\n'.format(test_start_date))
+    summary_file.write('Test end: {}\n'.format(test_end_date))
+    summary_file.write('Total number of transactions: {}\n'.format(num_transactions))
+    summary_file.write('Successful transactions: {}\n'.format(successful_transactions))
+    summary_file.write('Wall-clock time: {}\n'.format(wall_time))
+    summary_file.write('Transactions per second: {}\n'.format(num_transactions/wall_time if wall_time else 0.0))
+    summary_file.write('Transactions per second (success): {}\n'.format(successful_transactions/wall_time if wall_time else 0.0))
+    write_latencies(summary_file, '', stats.latency)
+    summary_file.write('\n')
+    write_status_table(summary_file, stats)
+
+def write_retry_summary(summary_file, retry_stats, retries, completed, test_start_date, test_end_date):
+    # goodput counts items that eventually succeeded, whatever the attempt
+    wall_time = (test_end_date - test_start_date).total_seconds()
+    summary_file.write('Retries: {}\n'.format(retry_stats.count()))
+    summary_file.write('Retries dropped (attempts or budget exhausted): {}\n'.format(retries.dropped))
+    summary_file.write('Completed items: {}\n'.format(completed))
+    summary_file.write('Goodput (completed items per second): {}\n'.format(completed/wall_time if wall_time else 0.0))
+    write_latencies(summary_file, ' (retries)', retry_stats.latency)
+    summary_file.write('\n')
+    write_status_table(summary_file, retry_stats)
+
+def write_payload_summary(summary_file, payloads):
+    summary_file.write('Payload encoding: {}\n'.format(', '.join(sorted(payloads.encodings))))
+    summary_file.write('Request body bytes (total): {}\n'.format(payloads.body_bytes))
+    summary_file.write('Request body bytes (stored): {}\n'.format(payloads.bodies.size))
+    summary_file.write('Request body bytes per transaction: {}\n'.format(payloads.body_bytes/payloads.count if payloads.count else 0.0))
+    summary_file.write('JSON body bytes per transaction: {}\n'.format(payloads.json_bytes/payloads.count if payloads.count else 0.0))
+    write_latencies(summary_file, ' (serialization)', payloads.serialization)
+
+def write_phase_summary(summary_file, phase_stats):
+    for phase in PHASES:
+        histogram = phase_stats.phases[phase]
+        if histogram.count:
+            summary_file.write('Transactions timed ({}): {}\n'.format(phase, histogram.count))
+            write_latencies(summary_file, ' ({})'.format(phase), histogram)
+
+def write_server_timing_summary(summary_file, hop_stats):
+    # the Server-Timing hops reported by the upstreams, see servertiming.py
+    for hop, histogram in hop_stats.hops.items():
+        summary_file.write('Transactions timed by the server ({}): {}\n'.format(hop, histogram.count))
+        write_latencies(summary_file, ' ({})'.format(hop), histogram)
+
+DRIFT_COLUMNS = ('throughput', 'error_rate', 'p50', 'p99')
+
+def write_drift_summary(summary_file, series):
+    # early and late medians of the per-window values, flagged when the
+    # Mann-Whitney p-value is below DRIFT_ALPHA
+    summary_file.write('Soak windows: {} of {} s\n'.format(sum(1 for _ in series.rows()), series.window))
+    for column in DRIFT_COLUMNS:
+        drift = series.drift(column)
+        if drift is None:
+            summary_file.write('Drift ({}): not enough windows\n'.format(column))
+            continue
+        early, late, p_value = drift
+        summary_file.write('Drift ({}): early {}, late {}, p-value {}{}\n'.format(
+            column, early, late, p_value, ', significant' if p_value < drift_alpha else ''))
@@ -0,0 +1,209 @@
+# Append-only columnar store of raw transaction results. Every transaction is
+# a row of fixed-width columns; rows are buffered in arrays and handed in
+# batches to a writer thread that appends each column to its own file, so the
+# hot path never touches the disk. A run directory holds one <column>.bin per
+# column (raw little-endian values, dtypes in COLUMNS) and meta.json with the
+# run settings, and load()/load_runs() read runs back as numpy arrays. The
+# metadata also records the CPU time and peak memory of the process while the
+# store was open, which is the timed region of every driver. Each row holds the
+# number of its X-Request-ID, and the Server-Timing hops of its response go to
+# a second, long-format table of (row, hop, duration) read by
+# load_server_timing(); both come from servertiming.last(), so record() must
+# be called from the thread or task that made the request.
+import os
+import sys
+import json
+import time
+import queue
+import datetime
+import threading
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from config import *
+
+import servertiming
+
+# mixed runs (mix.py) and pipelined runs (pipeline.py) record the operation
+# of each row
+SCENARIOS = ('keygen', 'save', 'query', 'mixed', 'pipeline')
+
+# name, array typecode, numpy dtype
+COLUMNS = (
+    ('scenario', 'B', '<u1'),
+    ('start', 'd', '<f8'),
+    ('latency', 'd', '<f8'),
+    ('status', 'H', '<u2'),
+    ('bytes', 'Q', '<u8'),
+    ('retry', 'B', '<u1'),
+    ('request', 'Q', '<u8')
+)
+
+# one row per hop of a transaction; hop indexes the 'hops' of the metadata
+TIMING_COLUMNS = (
+    ('timing_row', 'Q', '<u8'),
+    ('timing_hop', 'H', '<u2'),
+    ('timing_duration', 'd', '<f8')
+)
+
+def reset_peak_rss():
+    # Linux only; elsewhere the peak includes everything before the run
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+def peak_rss():
+    # peak resident set size of the process in bytes, or None
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return None
+
+class ResultStore(object):
+    def __init__(self, path, scenario, metadata=None, batch_size=None):
+        self.path = path
+        self.scenario = SCENARIOS.index(scenario)
+        self.metadata = dict(metadata or {}, scenario=scenario)
+        self.batch_size = batch_size or raw_batch_size
+        self.rows = 0
+        self.hops = {}
+        self.lock = threading.Lock()
+        self.batch = self.new_batch()
+        self.batches = queue.Queue()
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for name, _, _ in COLUMNS + TIMING_COLUMNS:
+            open(os.path.join(path, name + '.bin'), 'wb').close()
+        reset_peak_rss()
+        self.cpu_started = time.process_time()
+        self.started = time.perf_counter()
+        self.metadata['start'] = str(datetime.datetime.utcnow())
+        self.writer = threading.Thread(target=self.write_batches, daemon=True)
+        self.writer.start()
+
+    def new_batch(self):
+        return [array(typecode) for _, typecode, _ in COLUMNS + TIMING_COLUMNS]
+
+    def record(self, status_code, latency, num_bytes=0, attempt=0, scenario=None):
+        # the start offset is taken from the completion time, so it includes
+        # any delay the latency includes (e.g. open-loop queueing)
+        start = time.perf_counter() - self.started - latency
+        scenario = self.scenario if scenario is None else SCENARIOS.index(scenario)
+        request, timings = servertiming.last()
+        with self.lock:
+            for column, value in zip(self.batch, (scenario, start, latency, status_code, num_bytes, 1 if attempt else 0, request)):
+                column.append(value)
+            if timings:
+                rows, hops, durations = self.batch[len(COLUMNS):]
+                for hop, duration in timings.items():
+                    rows.append(self.rows)
+                    hops.append(self.hops.setdefault(hop, len(self.hops)))
+                    durations.append(duration)
+            self.rows += 1
+            if len(self.batch[0]) >= self.batch_size:
+                self.batches.put(self.batch)
+                self.batch = self.new_batch()
+
+    def write_batches(self):
+        files = [open(os.path.join(self.path, name + '.bin'), 'ab') for name, _, _ in COLUMNS + TIMING_COLUMNS]
+        try:
+            for batch in iter(self.batches.get, None):
+                for column_file, column in zip(files, batch):
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    column.tofile(column_file)
+        finally:
+            for column_file in files:
+                column_file.close()
+
+    def close(self, **metadata):
+        with self.lock:
+            self.batches.put(self.batch)
+            self.batch = self.new_batch()
+        self.batches.put(None)
+        self.writer.join()
+        self.metadata['cpu_seconds'] = time.process_time() - self.cpu_started
+        self.metadata['peak_rss'] = peak_rss()
+        self.metadata.update(metadata)
+        self.metadata['end'] = str(datetime.datetime.utcnow())
+        self.metadata['rows'] = self.rows
+        self.metadata['columns'] = dict((name, dtype) for name, _, dtype in COLUMNS)
+        self.metadata['timing_columns'] = dict((name, dtype) for name, _, dtype in TIMING_COLUMNS)
+        self.metadata['hops'] = sorted(self.hops, key=self.hops.get)
+        self.metadata['request_id_prefix'] = servertiming.prefix
+        self.metadata['scenarios'] = SCENARIOS
+        with open(os.path.join(self.path, 'meta.json'), 'w') as meta_file:
+            json.dump(self.metadata, meta_file, indent=4)
+
+def run_settings():
+    return {
+        'connection_mode': connection_mode,
+        'arrival_rate': arrival_rate,
+        'arrival_process': arrival_process,
+        'concurrency': concurrency,
+        'payload_encoding': payload_encoding,
+        'run_label': run_label,
+        'soak_duration': soak_duration,
+        'upstreams': il_upstream_urls,
+        'load_balancing': load_balancing
+    }
+
+def load_columns(path, column_types):
+    if numpy is None:
+        raise ImportError('loading raw results needs numpy')
+    columns = {}
+    for name, dtype in column_types.items():
+        column_path = os.path.join(path, name + '.bin')
+        if os.path.getsize(column_path):
+            columns[name] = numpy.memmap(column_path, dtype=dtype, mode='r')
+        else:
+            columns[name] = numpy.zeros(0, dtype=dtype)
+    return columns
+
+def load_metadata(path):
+    with open(os.path.join(path, 'meta.json')) as meta_file:
+        return json.load(meta_file)
+
+def load(path):
+    # returns (columns, metadata); columns are memory-mapped numpy arrays
+    metadata = load_metadata(path)
+    return load_columns(path, metadata['columns']), metadata
+
+def load_server_timing(path):
+    # returns (columns, hops): the timing_* columns, whose timing_row indexes
+    # the columns of load(), and the hop names timing_hop indexes
+    metadata = load_metadata(path)
+    return load_columns(path, metadata.get('timing_columns', {})), metadata.get('hops', [])
+
+def load_runs(paths):
+    # concatenates several runs, adding a 'run' column that indexes the
+    # returned metadata list
+    runs = [load(path) for path in paths]
+    metadata = [run_metadata for _, run_metadata in runs]
+    columns = {}
+    for name, _, dtype in COLUMNS:
+        # runs recorded before a column existed get zeros
+        columns[name] = numpy.concatenate([run_columns[name] if name in run_columns else numpy.zeros(len(run_columns['latency']), dtype=dtype)
+                                           for run_columns, _ in runs]) if runs else numpy.zeros(0, dtype=dtype)
+    columns['run'] = numpy.concatenate([numpy.full(len(run_columns['latency']), index, dtype='<u4')
+                                        for index, (run_columns, _) in enumerate(runs)]) if runs else numpy.zeros(0, dtype='<u4')
+    return columns, metadata
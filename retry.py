@@ -0,0 +1,70 @@
+# Retry scheduler for failed transactions. A failed item is retried itself,
+# after a capped exponential backoff with full jitter, and only while the run
+# is within its retry budget: at most retry_budget retries per first attempt
+# plus retry_budget_min. An overloaded server therefore sees a bounded trickle
+# of retries instead of an immediate retry storm. interleave() yields retries
+# as they fall due between first attempts; drain() yields those left at the end.
+import time
+import heapq
+import random
+import itertools
+
+from config import *
+
+class RetryScheduler(object):
+    def __init__(self, budget=None, budget_min=None, base_delay=None, max_delay=None, max_attempts=None):
+        self.budget = retry_budget if budget is None else budget
+        self.budget_min = retry_budget_min if budget_min is None else budget_min
+        self.base_delay = retry_base_delay if base_delay is None else base_delay
+        self.max_delay = retry_max_delay if max_delay is None else max_delay
+        self.max_attempts = retry_max_attempts if max_attempts is None else max_attempts
+        self.first_attempts = 0
+        self.retries = 0
+        self.dropped = 0
+        self.pending = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def attempted(self, attempt):
+        if attempt == 0:
+            self.first_attempts += 1
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def schedule(self, item, attempt):
+        # attempt is the number of the retry being scheduled, starting at 1
+        if attempt >= self.max_attempts or self.retries >= self.budget * self.first_attempts + self.budget_min:
+            self.dropped += 1
+            return False
+        self.retries += 1
+        heapq.heappush(self.pending, (time.time() + self.backoff(attempt), next(self.sequence), item, attempt))
+        return True
+
+    def due(self):
+        # yields the (item, attempt) retries that are due now, without waiting
+        while self.pending and self.pending[0][0] <= time.time():
+            _, _, item, attempt = heapq.heappop(self.pending)
+            yield item, attempt
+
+    def interleave(self, items):
+        # yields (item, 0) for every item, each preceded by the retries due by
+        # then, and then the remaining retries as they fall due
+        for item in items:
+            for retry in self.due():
+                yield retry
+            yield item, 0
+        for retry in self.drain():
+            yield retry
+
+    def drain(self):
+        # yields (item, attempt) as retries fall due; retries scheduled while
+        # draining are picked up too
+        while self.pending:
+            due, _, item, attempt = heapq.heappop(self.pending)
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            yield item, attempt
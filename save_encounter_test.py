@@ -2,18 +2,17 @@
 # docker exec abeinpos_abe-in-pos_1 python3 key_generation_test.py <policy_size> <num_attributes> <num_txns>_encounters.json
 import sys
 import os
-import time
 import json
-import requests
-import datetime
-import warnings
-import random
 
 import logging
 
-from functools import reduce
-
 from config import *
+from report import atomic_write, summary_suffix
+from datasets import iter_records, iter_raw_records
+from credentials import CredentialStore, reference
+from driver import Driver
+
+import scenarios
 
 test_data_dir = 'input'
 output_data_dir = 'data'
@@ -24,94 +23,33 @@ input_filename = sys.argv[3]
 
 num_txns_str = input_filename.split("_")[0]
 
-users_file_name = 'users_{}_{}_{}.json'.format(policy_size, num_attributes, num_txns_str)
-encounter_ids_file_name = '{}_encounter_ids_{}_{}.json'.format(num_txns_str, policy_size, num_attributes)
-transaction_summary_file_name = '{}_{}_{}_save_transaction_summary.txt'.format(policy_size, num_attributes, num_txns_str)
+users_file_name = 'users_{}_{}_{}.jsonl'.format(policy_size, num_attributes, num_txns_str)
+encounter_ids_file_name = '{}_encounter_ids_{}_{}.jsonl'.format(num_txns_str, policy_size, num_attributes)
+transaction_summary_file_name = '{}_{}_{}_save_transaction_summary{}.txt'.format(policy_size, num_attributes, num_txns_str, summary_suffix())
 
 users_file_path = os.path.join(test_data_dir, users_file_name)
 input_path = os.path.join(test_data_dir, input_filename)
 encounter_ids_path = os.path.join(test_data_dir, encounter_ids_file_name)
 
-transaction_summary_path = os.path.join(output_data_dir, transaction_summary_file_name)
-
-with open(users_file_path) as users_file:
-    users = json.load(users_file)
-
-with open(input_path) as input_file:
-    encounters = json.load(input_file)
-
-transaction_times_success = []
-transaction_times = []
-status_codes = []
-encounter_ids = []
-error_count = 0
-
-def save(encounter, user, retry=False):
-    global error_count
-    start = time.time()
-    encounter['policy'] = user['policy']
-    encounter['user_id'] = user['user_id']
-    response = requests.post('{}/encounters/'.format(il_upstream_url),
-                            json=encounter, 
-                            headers=headers, 
-                            auth=auth,
-                            verify=False)
-    end = time.time()
-    print(response.status_code) 
-    transaction_time = end - start
-
-    if response.status_code == 201:
-        transaction_times_success.append(transaction_time)
-        encounter_ids.append({
-            'user': user,
-            'encounter_id': response.json()['encounter_id']
-        })
-    else:
-        error_count += 1
-    if not retry:
-        status_codes.append(response.status_code)        
-        transaction_times.append(transaction_time)
-
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-    eupair = list(zip(encounters, users))
-    test_start_date = datetime.datetime.utcnow()
-    for encounter, user in eupair:
-        save(encounter, user)
-    while error_count > 0:
-        retries = error_count
-        error_count = 0
-        while retries > 0:
-            encounter, user = random.choice(eupair)
-            save(encounter, user, True)
-            retries -= 1
-    test_end_date = datetime.datetime.utcnow()
+credentials = CredentialStore() if credential_store else None
+# with a credential store the users are pulled from it in registration order
+# and the encounter IDs file refers to them without their private keys
+def users():
+    return credentials.users(policy_size, num_attributes) if credentials else iter_records(users_file_path)
 
-with open(encounter_ids_path, "w") as encounter_ids_file:
-    print("number of encounters: {}".format(len(encounter_ids)))
-    json.dump(encounter_ids, encounter_ids_file)
+def saved(user, contents):
+    encounter_ids_file.write(json.dumps({
+        'user': reference(user) if credentials else user,
+        'encounter_id': contents['encounter_id']
+    }) + '\n')
 
-with open(transaction_summary_path, "w") as transaction_summary_file:
-    total_time = sum(transaction_times)
-    num_transactions = len(transaction_times)
-    avg_txn_time = total_time/float(num_transactions)
-    rate = 1/avg_txn_time
+driver = Driver('save', os.path.splitext(transaction_summary_file_name)[0], scenarios.save, lambda user: '/encounters/', 201,
+                dict(policy_size=policy_size, num_attributes=num_attributes, input=input_filename), saved, output_data_dir)
+# the encounter IDs of an earlier run are only replaced by a run that completes
+# and saved some
+with atomic_write(encounter_ids_path, keep_empty=False) as encounter_ids_file:
+    driver.run(driver.payloads.prepare(lambda: zip(iter_raw_records(input_path), users()), lambda pair: driver.payloads.encounter(*pair), users))
 
-    total_time_success = sum(transaction_times_success)
-    avg_txn_time_success = total_time_success/float(num_transactions)
-    rate_success = 1/avg_txn_time_success
+print("number of encounters: {}".format(driver.succeeded))
 
-    successful_transactions = reduce(lambda a,b: a + b, map(lambda x: 1 if x == 201 else 0, status_codes))
-    transaction_summary_file.write('Test start: {}\n'.format(test_start_date))
-    transaction_summary_file.write('Test end: {}\n'.format(test_end_date))
-    transaction_summary_file.write('Total number of transactions: {}\n'.format(num_transactions))
-    transaction_summary_file.write('Total time: {}\n'.format(total_time))
-    transaction_summary_file.write('Average transaction time: {}\n'.format(avg_txn_time))
-    transaction_summary_file.write('Average transaction time (success): {}\n'.format(avg_txn_time_success))
-    transaction_summary_file.write('Transactions per second: {}\n'.format(rate))
-    transaction_summary_file.write('Transactions per second (success): {}\n'.format(rate_success))
-    transaction_summary_file.write('Successful transactions: {}\n'.format(successful_transactions))
-    transaction_summary_file.write('\n')
-    transaction_summary_file.writelines(["{}, {}\n".format(status_code, txn_time) for txn_time, status_code in zip(transaction_times, status_codes)])
-    transaction_summary_file.write('\n')
-    transaction_summary_file.writelines(["{}, {}\n".format(201, txn_time) for txn_time in transaction_times_success])
\ No newline at end of file
+driver.write_summary()
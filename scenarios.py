@@ -0,0 +1,36 @@
+# Transactions for the asyncio load engine (loadgen.py). Each scenario takes an
+# aiohttp session and one ((body, body_headers), meta) item, with the body
+# prepared by payloads.py, and returns (status_code, contents); contents is the
+# decoded response body on success and None otherwise.
+import json
+import time
+
+from config import *
+from balancer import upstreams
+from transport import phases
+
+import servertiming
+
+async def post(session, path, body, body_headers, success_code):
+    with upstreams.select() as upstream_url:
+        async with session.post('{}{}'.format(upstream_url, path), data=body, headers=servertiming.begin(body_headers)) as response:
+            servertiming.finish(response.headers)
+            start = time.perf_counter()
+            content = await response.read()
+            if phase_timing:
+                phases.record({'download': time.perf_counter() - start})
+            if response.status == success_code:
+                return response.status, json.loads(content.decode('utf-8'))
+            return response.status, None
+
+async def save_user(session, item):
+    (body, body_headers), user_meta = item
+    return await post(session, '/user', body, body_headers, 200)
+
+async def save(session, item):
+    (body, body_headers), user = item
+    return await post(session, '/encounters/', body, body_headers, 201)
+
+async def query(session, item):
+    (body, body_headers), (encounter_id, user) = item
+    return await post(session, '/encounters/{}'.format(encounter_id), body, body_headers, 200)
@@ -0,0 +1,241 @@
+# USAGE:
+# python3 selfbench.py [<num_txns> [<concurrency>]]
+# python3 selfbench.py compare <baseline>.csv <current>.csv
+# Benchmarks the harness itself. The key generation, save and query scripts
+# are run unchanged against a local sink that answers every request at once
+# from precomputed responses, synchronously (CONCURRENCY=1) and with
+# <concurrency> and 4 * <concurrency> workers, for every image in
+# test_data/images. Each run reports the throughput the harness reached, the
+# CPU time it spent per request and its peak memory (see resultstore.py), and
+# the two concurrent runs give the memory per in-flight request. Results go to
+# data/selfbench_<commit>.csv; compare flags rows of the current file whose
+# throughput fell or CPU per request rose by more than SELFBENCH_TOLERANCE.
+import sys
+import os
+import csv
+import json
+import base64
+import shutil
+import asyncio
+import tempfile
+import platform
+import subprocess
+import multiprocessing
+
+from array import array
+
+from config import *
+from policies import PolicyGenerator
+
+source_dir = os.path.dirname(os.path.abspath(__file__))
+images_dir = os.path.join(source_dir, 'test_data', 'images')
+sample_path = os.path.join(source_dir, 'test_data', 'sample.json')
+output_data_dir = 'data'
+
+policy_size = 64
+num_attributes = 64
+tolerance = float(os.environ.get('SELFBENCH_TOLERANCE', 0.1))
+
+# driver, script, success code
+DRIVERS = (
+    ('keygen', 'key_generation_test.py', 200),
+    ('save', 'save_encounter_test.py', 201),
+    ('query', 'query_encounter_test.py', 200)
+)
+
+COLUMNS = ('commit', 'python', 'driver', 'image', 'mode', 'concurrency', 'transactions', 'errors', 'throughput',
+           'cpu_per_request_us', 'cpu_utilization', 'peak_rss_mb', 'memory_per_in_flight_kb')
+
+def http_response(status, reason, body):
+    return 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'.format(
+        status, reason, len(body)).encode('latin-1') + body
+
+class Sink(asyncio.Protocol):
+    # HTTP/1.1 with keep-alive; requests are told apart by their path only
+    def __init__(self, responses):
+        self.responses = responses
+        self.buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while True:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                return
+            lines = self.buffer[:end].decode('latin-1').split('\r\n')
+            length = 0
+            close = False
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                name = name.strip().lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'connection':
+                    close = value.strip().lower() == 'close'
+            if len(self.buffer) < end + 4 + length:
+                return
+            del self.buffer[:end + 4 + length]
+            path = lines[0].split(' ')[1]
+            if path.endswith('/user'):
+                self.transport.write(self.responses['keygen'])
+            elif path.endswith('/encounters/'):
+                self.transport.write(self.responses['save'])
+            else:
+                self.transport.write(self.responses['query'])
+            if close:
+                self.transport.close()
+                return
+
+def serve(responses, connection):
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(loop.create_server(lambda: Sink(responses), '127.0.0.1', 0))
+    connection.send(server.sockets[0].getsockname()[1])
+    loop.run_forever()
+
+def start_sink(encounter):
+    responses = {
+        'keygen': http_response(200, 'OK', json.dumps({
+            'user_id': 'selfbench',
+            'private_key': base64.b64encode(os.urandom(mock_key_size)).decode('ascii')
+        }).encode('utf-8')),
+        'save': http_response(201, 'Created', json.dumps({'encounter_id': 'selfbench'}).encode('utf-8')),
+        'query': http_response(200, 'OK', json.dumps(encounter).encode('utf-8'))
+    }
+    parent, child = multiprocessing.Pipe()
+    sink = multiprocessing.Process(target=serve, args=(responses, child), daemon=True)
+    sink.start()
+    return sink, parent.recv()
+
+def commit_name():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=source_dir,
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def read_column(path, name, typecode):
+    column = array(typecode)
+    with open(os.path.join(path, name + '.bin'), 'rb') as column_file:
+        column.frombytes(column_file.read())
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+def run_driver(work_dir, port, script, args, workers, success_code):
+    # one run of a driver in a process of its own; its raw results hold the
+    # timings, CPU time and peak memory of the timed region
+    raw_dir = os.path.join(work_dir, 'data', 'raw')
+    shutil.rmtree(raw_dir, ignore_errors=True)
+    url = 'http://127.0.0.1:{}'.format(port)
+    env = dict(os.environ, IL_UPSTREAM_URL=url, IL_UPSTREAM_URLS=url, CONCURRENCY=str(workers),
+               ARRIVAL_RATE='0', SOAK_DURATION='0', CREDENTIAL_STORE='')
+    subprocess.run([sys.executable, os.path.join(source_dir, script)] + args, cwd=work_dir, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    path = os.path.join(raw_dir, os.listdir(raw_dir)[0])
+    with open(os.path.join(path, 'meta.json')) as meta_file:
+        metadata = json.load(meta_file)
+    start = read_column(path, 'start', 'd')
+    latency = read_column(path, 'latency', 'd')
+    status = read_column(path, 'status', 'H')
+    elapsed = max(begin + duration for begin, duration in zip(start, latency)) - min(start) if start else 0.0
+    transactions = len(start)
+    return {
+        'mode': 'sync' if workers == 1 else 'concurrent',
+        'concurrency': workers,
+        'transactions': transactions,
+        'errors': sum(1 for code in status if code != success_code),
+        'throughput': transactions / elapsed if elapsed else 0.0,
+        'cpu_per_request_us': metadata['cpu_seconds'] / transactions * 1e6 if transactions else 0.0,
+        'cpu_utilization': metadata['cpu_seconds'] / elapsed if elapsed else 0.0,
+        'peak_rss_mb': metadata['peak_rss'] / 1048576.0 if metadata.get('peak_rss') else '',
+        'peak_rss': metadata.get('peak_rss')
+    }
+
+def write_inputs(work_dir, num_txns, encounters, image_bytes):
+    users_path = os.path.join(work_dir, 'input', 'run {} {} {}.json'.format(num_txns, policy_size, num_attributes))
+    if not os.path.exists(users_path):
+        with open(users_path, 'w') as users_file:
+            users_file.writelines(PolicyGenerator(policy_size, num_attributes).lines(num_txns))
+    image = base64.b64encode(image_bytes).decode('ascii')
+    with open(os.path.join(work_dir, 'input', '{}_encounters.jsonl'.format(num_txns)), 'w') as encounters_file:
+        for index in range(num_txns):
+            encounters_file.write(json.dumps(dict(encounters[index % len(encounters)], image=image)) + '\n')
+    return dict(encounters[0], image=image)
+
+def bench(num_txns, concurrency):
+    commit = commit_name()
+    with open(sample_path) as sample_file:
+        encounters = json.load(sample_file)
+    images = sorted(os.listdir(images_dir), key=lambda name: os.path.getsize(os.path.join(images_dir, name)))
+    levels = (1, concurrency, 4 * concurrency)
+    work_dir = tempfile.mkdtemp(prefix='selfbench')
+    os.makedirs(os.path.join(work_dir, 'input'))
+    os.makedirs(os.path.join(work_dir, 'data'))
+    rows = []
+    try:
+        for image_index, image_name in enumerate(images):
+            with open(os.path.join(images_dir, image_name), 'rb') as image_file:
+                encounter = write_inputs(work_dir, num_txns, encounters, image_file.read())
+            sink, port = start_sink(encounter)
+            try:
+                for driver, script, success_code in DRIVERS:
+                    # key generation sends no image, so it is run once
+                    if driver == 'keygen' and image_index:
+                        continue
+                    if driver == 'keygen':
+                        args = [str(policy_size), str(num_attributes), str(num_txns)]
+                    else:
+                        args = [str(policy_size), str(num_attributes), '{}_encounters.jsonl'.format(num_txns)]
+                    runs = []
+                    for workers in levels:
+                        row = run_driver(work_dir, port, script, args, workers, success_code)
+                        row.update(commit=commit, python=platform.python_version(), driver=driver,
+                                   image=image_name if driver != 'keygen' else '')
+                        print('{} {} {}: {:.0f}/s, {:.0f} us CPU per request'.format(
+                            driver, row['image'] or '-', workers, row['throughput'], row['cpu_per_request_us']))
+                        runs.append(row)
+                    low, high = runs[1], runs[2]
+                    if low['peak_rss'] and high['peak_rss']:
+                        per_in_flight = (high['peak_rss'] - low['peak_rss']) / float(high['concurrency'] - low['concurrency']) / 1024.0
+                        low['memory_per_in_flight_kb'] = high['memory_per_in_flight_kb'] = per_in_flight
+                    rows.extend(runs)
+            finally:
+                sink.terminate()
+                sink.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not os.path.exists(output_data_dir):
+        os.makedirs(output_data_dir)
+    output_path = os.path.join(output_data_dir, 'selfbench_{}.csv'.format(commit))
+    with open(output_path, 'w', newline='') as output_file:
+        writer = csv.DictWriter(output_file, COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    print(output_path)
+
+def compare(baseline_path, current_path):
+    # returns the number of regressions
+    def read(path):
+        with open(path, newline='') as csv_file:
+            return dict(((row['driver'], row['image'], row['concurrency']), row) for row in csv.DictReader(csv_file))
+    baseline = read(baseline_path)
+    regressions = 0
+    for key, row in sorted(read(current_path).items()):
+        if key not in baseline:
+            continue
+        throughput = float(row['throughput']) / float(baseline[key]['throughput'])
+        cpu = float(row['cpu_per_request_us']) / float(baseline[key]['cpu_per_request_us'])
+        regressed = throughput < 1 - tolerance or cpu > 1 + tolerance
+        regressions += regressed
+        print('{} {} {}: throughput x{:.2f}, CPU per request x{:.2f}{}'.format(
+            key[0], key[1] or '-', key[2], throughput, cpu, ' REGRESSION' if regressed else ''))
+    return regressions
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3]) else 0)
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 16)
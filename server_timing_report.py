@@ -0,0 +1,68 @@
+# USAGE:
+# python3 server_timing_report.py <raw_run_dir> [<raw_run_dir> ...]
+# Attributes the latency of recorded runs (data/raw/<summary name>/ or
+# results/raw/<summary name>/) to the downstream hops named in the upstreams'
+# Server-Timing headers, e.g. data/raw/*_query_transaction_summary* for runs
+# with growing payloads. For the transactions of each run and scenario that
+# reported server timings, data/server_timing_report.csv gets the mean, p50 and
+# p99 of the client latency ('total'), of every hop (0 where a transaction did
+# not report it) and of what the hops leave unaccounted for ('client': network,
+# queueing and the harness), and the share of the mean latency of each.
+import sys
+import os
+import csv
+
+from resultstore import SCENARIOS, load, load_server_timing, numpy
+
+output_data_dir = 'data'
+report_path = os.path.join(output_data_dir, 'server_timing_report.csv')
+
+COLUMNS = ('run', 'input', 'scenario', 'hop', 'transactions', 'mean', 'p50', 'p99', 'share')
+
+def attribute(path):
+    columns, metadata = load(path)
+    timing, hops = load_server_timing(path)
+    num_rows = len(columns['latency'])
+    timed = numpy.zeros(num_rows, dtype=bool)
+    timed[timing['timing_row']] = True
+    server = numpy.bincount(timing['timing_row'], weights=timing['timing_duration'], minlength=num_rows)
+    by_hop = []
+    for index, hop in enumerate(hops):
+        durations = numpy.zeros(num_rows)
+        selected = timing['timing_hop'] == index
+        durations[timing['timing_row'][selected]] = timing['timing_duration'][selected]
+        by_hop.append((hop, durations))
+    run = os.path.basename(os.path.normpath(path))
+    for scenario in numpy.unique(columns['scenario']):
+        rows = timed & (columns['scenario'] == scenario)
+        if not rows.any():
+            continue
+        latency = columns['latency'][rows]
+        total = latency.mean()
+        series = [('total', latency)] + [(hop, durations[rows]) for hop, durations in by_hop] + [('client', latency - server[rows])]
+        for hop, values in series:
+            yield {
+                'run': run,
+                'input': metadata.get('input', metadata.get('file_size', '')),
+                'scenario': SCENARIOS[scenario],
+                'hop': hop,
+                'transactions': len(values),
+                'mean': values.mean(),
+                'p50': numpy.percentile(values, 50),
+                'p99': numpy.percentile(values, 99),
+                'share': values.mean() / total if total else 0.0
+            }
+
+rows = []
+for path in sys.argv[1:]:
+    for row in attribute(path):
+        print('{run} {scenario} {hop}: p50 {p50:.6f}, p99 {p99:.6f}, {share:.1%} of mean latency'.format(**row))
+        rows.append(row)
+
+if not os.path.exists(output_data_dir):
+    os.makedirs(output_data_dir)
+with open(report_path, 'w', newline='') as report_file:
+    writer = csv.DictWriter(report_file, COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+print('report: {}'.format(report_path))
@@ -0,0 +1,87 @@
+# Request IDs and server-side timings. Every request the harness sends carries
+# a unique X-Request-ID, <process prefix>-<number>, and the Server-Timing
+# headers of its response ('<name>;dur=<milliseconds>, ...', as in the W3C
+# Server Timing spec) are parsed into seconds per downstream hop. The request
+# number and hops are kept as the last exchange of the calling thread or
+# asyncio task, where resultstore.py joins them to the transaction it records,
+# and the hops are also counted in the process-wide hops histograms that the
+# summaries report.
+import os
+import itertools
+import threading
+import contextvars
+
+from histogram import Histogram
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+# distinguishes the requests of concurrent processes, e.g. shards
+prefix = os.urandom(4).hex()
+_numbers = itertools.count(1)
+# (request number, {hop: seconds} or None); number 0 means no request yet
+_exchange = contextvars.ContextVar('exchange', default=(0, None))
+
+class HopStats(object):
+    def __init__(self):
+        self.hops = {}
+        self.lock = threading.Lock()
+
+    def record(self, timings):
+        with self.lock:
+            for hop, value in timings.items():
+                if hop not in self.hops:
+                    self.hops[hop] = Histogram()
+                self.hops[hop].record(value)
+
+# one per process, like transport.phases
+hops = HopStats()
+
+def parse(values):
+    # Server-Timing header values -> {hop: seconds}; metrics without a
+    # duration count as 0 and repeated metrics are added up
+    timings = {}
+    for value in values:
+        for metric in value.split(','):
+            parameters = metric.split(';')
+            name = parameters[0].strip()
+            if not name:
+                continue
+            duration = 0.0
+            for parameter in parameters[1:]:
+                key, _, number = parameter.partition('=')
+                if key.strip().lower() == 'dur':
+                    try:
+                        duration = float(number.strip().strip('"')) / 1000.0
+                    except ValueError:
+                        pass
+            timings[name] = timings.get(name, 0.0) + duration
+    return timings
+
+def header_values(response_headers):
+    # every Server-Timing header of a requests, http.client or aiohttp response
+    if hasattr(response_headers, 'getall'):
+        return response_headers.getall(SERVER_TIMING_HEADER, [])
+    if hasattr(response_headers, 'get_all'):
+        return response_headers.get_all(SERVER_TIMING_HEADER) or []
+    value = response_headers.get(SERVER_TIMING_HEADER)
+    return [value] if value else []
+
+def begin(request_headers=None):
+    # numbers the next request of this thread or task and returns its
+    # headers with the request ID added
+    number = next(_numbers)
+    _exchange.set((number, None))
+    request_headers = dict(request_headers or {})
+    request_headers[REQUEST_ID_HEADER] = '{}-{}'.format(prefix, number)
+    return request_headers
+
+def finish(response_headers):
+    values = header_values(response_headers)
+    if values:
+        timings = parse(values)
+        _exchange.set((_exchange.get()[0], timings))
+        hops.record(timings)
+
+def last():
+    return _exchange.get()
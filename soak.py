@@ -0,0 +1,126 @@
+# Soak runs. With SOAK_DURATION set the drivers cycle through their prepared
+# inputs until that many seconds have passed, and every completed transaction
+# is also counted in a SOAK_WINDOW second window of a time series. At the end
+# the first and last thirds of the windows are compared with a Mann-Whitney U
+# test, so gradual degradation (key stores growing on the TA, encounters piling
+# up on the SHR) is flagged rather than averaged away.
+import csv
+import math
+import time
+import threading
+
+from config import *
+from histogram import Stats
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+def run_for(items, duration=None):
+    deadline = time.monotonic() + (duration or soak_duration)
+    for item in items:
+        if time.monotonic() >= deadline:
+            return
+        yield item
+
+def cycle(items):
+    # passes over items again and again; unlike itertools.cycle it keeps no
+    # copy of them, so prepared inputs are streamed again on every pass
+    while True:
+        empty = True
+        for item in items:
+            empty = False
+            yield item
+        if empty:
+            return
+
+def cycle_for(items, duration=None):
+    return run_for(cycle(items), duration)
+
+def mann_whitney(early, late):
+    # two-sided p-value of the U statistic under the normal approximation,
+    # with tie and continuity corrections
+    values = sorted([(value, 0) for value in early] + [(value, 1) for value in late])
+    n = len(values)
+    rank_sum = 0.0
+    tie_correction = 0.0
+    position = 0
+    while position < n:
+        end = position
+        while end + 1 < n and values[end + 1][0] == values[position][0]:
+            end += 1
+        ties = end - position + 1
+        rank = (position + end) / 2.0 + 1
+        rank_sum += rank * sum(1 for _, group in values[position:end + 1] if group == 0)
+        tie_correction += ties ** 3 - ties
+        position = end + 1
+    n1, n2 = len(early), len(late)
+    u = rank_sum - n1 * (n1 + 1) / 2.0
+    mean = n1 * n2 / 2.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance <= 0:
+        return u, 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return u, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+class WindowSeries(object):
+    def __init__(self, success_code, window=None):
+        self.success_code = success_code
+        self.window = window or soak_window
+        self.windows = []
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.ended = None
+
+    def record(self, status_code, latency):
+        index = int((time.monotonic() - self.started) / self.window)
+        with self.lock:
+            while len(self.windows) <= index:
+                self.windows.append(Stats())
+            self.windows[index].record(status_code, latency)
+
+    def close(self):
+        self.ended = time.monotonic()
+
+    def stats(self, index):
+        return self.windows[index] if index < len(self.windows) else Stats()
+
+    def rows(self):
+        # one row per window up to the end of the run, so windows in which
+        # nothing completed (an outage, a stall) show up with throughput 0;
+        # their error rate and latencies are None, left blank in the CSV
+        elapsed = (self.ended or time.monotonic()) - self.started
+        for index in range(max(len(self.windows), int(math.ceil(elapsed / self.window)))):
+            stats = self.stats(index)
+            duration = min(self.window, elapsed - index * self.window)
+            successful = stats.count(self.success_code)
+            row = {
+                'window_start': index * self.window,
+                'duration': duration,
+                'transactions': stats.count(),
+                'successful': successful,
+                'throughput': successful / duration if duration > 0 else 0.0,
+                'error_rate': 1 - successful / float(stats.count()) if stats.count() else None
+            }
+            for percentile in PERCENTILES:
+                row['p{}'.format(percentile)] = stats.latency.percentile(percentile) if stats.count() else None
+            yield row
+
+    def write_csv(self, path):
+        rows = list(self.rows())
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, ['window_start', 'duration', 'transactions', 'successful', 'throughput', 'error_rate'] +
+                                    ['p{}'.format(percentile) for percentile in PERCENTILES])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def drift(self, column):
+        # (early median, late median, p-value), or None with too few windows;
+        # the last, partial window is left out, and so are the windows without
+        # transactions for the columns they have no value for (error rate and
+        # latencies), while their throughput of 0 counts
+        values = [row[column] for row in self.rows() if row['duration'] >= self.window and row[column] is not None]
+        third = len(values) // 3
+        if third < soak_min_windows:
+            return None
+        early, late = values[:third], values[-third:]
+        _, p_value = mann_whitney(early, late)
+        return sorted(early)[len(early) // 2], sorted(late)[len(late) // 2], p_value
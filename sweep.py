@@ -0,0 +1,151 @@
+# USAGE:
+# docker exec abeinpos_abe-in-pos_1 python3 sweep.py <matrix_spec>.json
+# Runs the key generation, save and query scripts for every combination in the
+# matrix spec and writes data/<spec>_results.csv, one row per run. Example spec:
+# {
+#     "scenarios": ["keygen", "save", "query"],
+#     "policy_size": [64, 128],
+#     "num_attributes": [64, 128],
+#     "num_txns": [100],
+#     "kb": [8, 128, 1024],
+#     "threads": [1, 8],
+#     "warmup": 10,
+#     "cooldown": 30
+# }
+# Inputs follow the script conventions: input/run <num_txns> <policy_size> <num_attributes>.json
+# for key generation and input/<num_txns>_encounters_<kb>kb.jsonl for save and query.
+# warmup transactions are sent (and discarded) before every measured run and the
+# sweep sleeps cooldown seconds after it; runs whose summary exists are skipped.
+import sys
+import os
+import csv
+import json
+import time
+import warnings
+import itertools
+import subprocess
+
+from config import *
+from datasets import iter_records, iter_raw_records
+from payloads import Payloads
+from report import summary_suffix
+from credentials import CredentialStore
+
+import loadgen
+import scenarios
+
+test_data_dir = 'input'
+output_data_dir = 'data'
+
+spec_path = sys.argv[1]
+with open(spec_path) as spec_file:
+    spec = json.load(spec_file)
+
+results_path = os.path.join(output_data_dir, '{}_results.csv'.format(os.path.splitext(os.path.basename(spec_path))[0]))
+
+dimensions = ('policy_size', 'num_attributes', 'num_txns', 'kb', 'threads')
+
+summary_file_names = {
+    'keygen': '{policy_size}_{num_attributes}_{num_txns}_key_generation_summary{suffix}.txt',
+    'save': '{policy_size}_{num_attributes}_{num_txns}_save_transaction_summary{suffix}.txt',
+    'query': '{policy_size}_{num_attributes}_{num_txns}_query_transaction_summary{suffix}.txt'
+}
+
+def label_for(scenario, run):
+    if scenario == 'keygen':
+        return '{}t'.format(run['threads'])
+    return '{}kb_{}t'.format(run['kb'], run['threads'])
+
+def summary_path(scenario, run):
+    return os.path.join(output_data_dir, summary_file_names[scenario].format(suffix=summary_suffix(label_for(scenario, run)), **run))
+
+def encounters_file_name(run):
+    return '{}_encounters_{}kb.jsonl'.format(run['num_txns'], run['kb'])
+
+def command(scenario, run):
+    if scenario == 'keygen':
+        script, last = 'key_generation_test.py', str(run['num_txns'])
+    elif scenario == 'save':
+        script, last = 'save_encounter_test.py', encounters_file_name(run)
+    else:
+        script, last = 'query_encounter_test.py', encounters_file_name(run)
+    return [sys.executable, script, str(run['policy_size']), str(run['num_attributes']), last]
+
+def warmup_inputs(scenario, run, num_txns):
+    payloads = Payloads()
+    if scenario == 'keygen':
+        test_users_path = os.path.join(test_data_dir, 'run {num_txns} {policy_size} {num_attributes}.json'.format(**run))
+        return payloads.prepare(lambda: iter_records(test_users_path, 0, num_txns), lambda user_meta: payloads.json({'attributes': user_meta['attributes']}))
+    # with a credential store, save and query take their users from it, as
+    # save_encounter_test.py and query_encounter_test.py do
+    credentials = CredentialStore() if credential_store else None
+    users_path = os.path.join(test_data_dir, 'users_{policy_size}_{num_attributes}_{num_txns}.jsonl'.format(**run))
+    users = (lambda: credentials.users(run['policy_size'], run['num_attributes'])) if credentials else (lambda: iter_records(users_path))
+    if scenario == 'save':
+        encounters_path = os.path.join(test_data_dir, encounters_file_name(run))
+        return payloads.prepare(lambda: zip(iter_raw_records(encounters_path, 0, num_txns), users()),
+                                lambda pair: payloads.encounter(*pair), users)
+    resolve = (lambda user: credentials.resolve(run['policy_size'], run['num_attributes'], user)) if credentials else (lambda user: user)
+    encounter_ids_path = os.path.join(test_data_dir, '{num_txns}_encounter_ids_{policy_size}_{num_attributes}.jsonl'.format(**run))
+    return payloads.prepare(lambda: ((encounter['encounter_id'], encounter['user']) for encounter in iter_records(encounter_ids_path, 0, num_txns)),
+                            lambda encounter: payloads.json({'private_key': resolve(encounter[1])['private_key']}))
+
+def warm_up(scenario, run, num_txns):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        loadgen.run(getattr(scenarios, {'keygen': 'save_user', 'save': 'save', 'query': 'query'}[scenario]),
+                    warmup_inputs(scenario, run, num_txns),
+                    lambda *result: None,
+                    workers=run['threads'])
+
+def read_summary(path):
+    # the leading 'name: value' lines describe the first attempts of the run
+    values = {}
+    with open(path) as summary_file:
+        for line in summary_file:
+            if not line.strip():
+                if values:
+                    break
+                continue
+            name, _, value = line.partition(': ')
+            values[name.strip()] = value.strip()
+    return values
+
+def runs():
+    # key generation only depends on the user set, so it runs once per
+    # policy_size/num_attributes/num_txns/threads and before the payload sizes
+    for policy_size, num_attributes, num_txns in itertools.product(spec['policy_size'], spec['num_attributes'], spec['num_txns']):
+        run = {'policy_size': policy_size, 'num_attributes': num_attributes, 'num_txns': num_txns, 'kb': '', 'threads': 1}
+        if 'keygen' in spec['scenarios']:
+            for threads in spec['threads']:
+                yield 'keygen', dict(run, threads=threads)
+        for kb, threads in itertools.product(spec['kb'], spec['threads']):
+            for scenario in ('save', 'query'):
+                if scenario in spec['scenarios']:
+                    yield scenario, dict(run, kb=kb, threads=threads)
+
+completed = []
+for scenario, run in runs():
+    path = summary_path(scenario, run)
+    if os.path.exists(path):
+        print('skipping {} {}'.format(scenario, run))
+    else:
+        print('running {} {}'.format(scenario, run))
+        if spec.get('warmup'):
+            warm_up(scenario, run, spec['warmup'])
+        env = dict(os.environ, CONCURRENCY=str(run['threads']), RUN_LABEL=label_for(scenario, run))
+        subprocess.check_call(command(scenario, run), env=env, stdout=subprocess.DEVNULL)
+        time.sleep(spec.get('cooldown', 0))
+    completed.append((scenario, run, read_summary(path)))
+
+columns = []
+for _, _, values in completed:
+    columns.extend(name for name in values if name not in columns)
+
+with open(results_path, 'w') as results_file:
+    writer = csv.writer(results_file)
+    writer.writerow(('scenario',) + dimensions + tuple(columns))
+    for scenario, run, values in completed:
+        writer.writerow([scenario] + [run[dimension] for dimension in dimensions] + [values.get(name, '') for name in columns])
+
+print('results: {}'.format(results_path))
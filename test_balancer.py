@@ -0,0 +1,38 @@
+# USAGE:
+# python3 -m unittest test_balancer
+import unittest
+
+from balancer import Upstreams
+
+URLS = ['http://il1', 'http://il2', 'http://il3']
+
+class UpstreamsTest(unittest.TestCase):
+    def test_round_robin(self):
+        upstreams = Upstreams(URLS, 'round_robin')
+        self.assertEqual([upstreams.acquire() for _ in range(4)], URLS + URLS[:1])
+        self.assertEqual(upstreams.sent, {'http://il1': 2, 'http://il2': 1, 'http://il3': 1})
+
+    def test_least_outstanding(self):
+        upstreams = Upstreams(URLS, 'least_outstanding')
+        # an idle start rotates between the replicas
+        self.assertEqual([upstreams.acquire() for _ in range(3)], URLS)
+        upstreams.release('http://il2')
+        self.assertEqual(upstreams.acquire(), 'http://il2')
+        upstreams.release('http://il1')
+        upstreams.release('http://il3')
+        self.assertIn(upstreams.acquire(), ('http://il1', 'http://il3'))
+
+    def test_select_releases(self):
+        upstreams = Upstreams(URLS, 'least_outstanding')
+        with self.assertRaises(RuntimeError):
+            with upstreams.select() as url:
+                self.assertEqual(upstreams.outstanding[url], 1)
+                raise RuntimeError()
+        self.assertEqual(upstreams.outstanding[url], 0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Upstreams(URLS, 'random')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# USAGE:
+# python3 -m unittest test_credentials
+import os
+import shutil
+import tempfile
+import unittest
+
+from credentials import CredentialStore, reference
+
+def user(user_id, attributes):
+    return {'user_id': user_id, 'private_key': 'key-' + user_id, 'policy': '(A or B)', 'attributes': attributes}
+
+class CredentialStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = CredentialStore(os.path.join(self.directory, 'credentials.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookup_by_attribute_set(self):
+        self.store.put(8, 8, user('u1', ['B', 'A']))
+        self.assertEqual(self.store.get(8, 8, ['A', 'B']), user('u1', ['B', 'A']))
+        self.assertIsNone(self.store.get(8, 16, ['A', 'B']))
+        self.assertEqual(self.store.registered(8, 8, {'attributes': ['A', 'B'], 'policy': '(A or B)'})['user_id'], 'u1')
+
+    def test_first_registration_kept(self):
+        self.store.put(8, 8, user('u1', ['A']))
+        self.store.put(8, 8, user('u2', ['A']))
+        self.assertEqual(self.store.get(8, 8, ['A'])['user_id'], 'u1')
+        self.assertEqual(self.store.count(8, 8), 1)
+
+    def test_users_in_registration_order(self):
+        for index, attributes in enumerate((['C'], ['A'], ['B'])):
+            self.store.put(8, 8, user('u{}'.format(index), attributes))
+        self.store.put(16, 16, user('other', ['A']))
+        self.assertEqual([stored['user_id'] for stored in self.store.users(8, 8)], ['u0', 'u1', 'u2'])
+        self.assertEqual([stored['user_id'] for stored in self.store.users(8, 8, 1, 2)], ['u1'])
+        self.assertEqual(self.store.user(8, 8, 2)['user_id'], 'u2')
+
+    def test_resolve(self):
+        stored = user('u1', ['A', 'B'])
+        self.store.put(8, 8, stored)
+        self.assertEqual(self.store.resolve(8, 8, reference(stored))['private_key'], 'key-u1')
+        self.assertIs(self.store.resolve(8, 8, stored), stored)
+        with self.assertRaises(KeyError):
+            self.store.resolve(8, 8, reference(user('u2', ['C'])))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+# USAGE:
+# python3 -m unittest test_datasets
+import io
+import json
+import unittest
+
+import datasets
+
+class IterJsonArrayTest(unittest.TestCase):
+    def setUp(self):
+        self.chunk_size = datasets.CHUNK_SIZE
+
+    def tearDown(self):
+        datasets.CHUNK_SIZE = self.chunk_size
+
+    def records(self, text):
+        return list(datasets.iter_json_array(io.BytesIO(text.encode('utf-8'))))
+
+    def test_number_split_at_chunk_boundary(self):
+        records = [123456789, 42, {'id': 987654321}, 3.14159, 2.5e-30, -7000]
+        text = json.dumps(records)
+        for chunk_size in range(1, len(text) + 2):
+            datasets.CHUNK_SIZE = chunk_size
+            self.assertEqual(self.records(text), records, 'chunk size {}'.format(chunk_size))
+
+    def test_records_larger_than_chunk(self):
+        records = [{'image': 'x' * 5000, 'n': index} for index in range(3)]
+        datasets.CHUNK_SIZE = 64
+        self.assertEqual(self.records(json.dumps(records)), records)
+
+    def test_empty_array(self):
+        datasets.CHUNK_SIZE = 1
+        self.assertEqual(self.records('[ ]'), [])
+
+    def test_truncated_record(self):
+        datasets.CHUNK_SIZE = 4
+        with self.assertRaises(ValueError):
+            self.records('[{"a": 1}, {"b": ')
+
+if __name__ == '__main__':
+    unittest.main()
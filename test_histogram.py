@@ -0,0 +1,75 @@
+# USAGE:
+# python3 -m unittest test_histogram
+import random
+import unittest
+
+from histogram import Histogram, Stats
+
+class HistogramTest(unittest.TestCase):
+    def exact_percentile(self, values, percentile):
+        values = sorted(values)
+        return values[max(1, int(round(len(values) * percentile/100.0 + 0.4999999))) - 1]
+
+    def test_percentile_error_bound(self):
+        rng = random.Random(0)
+        values = [rng.lognormvariate(-3, 1.5) for _ in range(20000)] + [0.0005, 2.5, 120.0]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        for percentile in (1, 10, 50, 90, 99, 99.9, 100):
+            exact = self.exact_percentile(values, percentile)
+            # one unit of truncation plus the relative error of a bucket
+            self.assertLessEqual(abs(histogram.percentile(percentile) - exact), exact / 128 + histogram.unit,
+                                 'p{}'.format(percentile))
+
+    def test_index_roundtrip(self):
+        histogram = Histogram(highest=10.0)
+        for ticks in list(range(2000)) + [2 ** shift + offset for shift in range(11, 23) for offset in (-1, 0, 1)]:
+            index = histogram._index(ticks)
+            self.assertGreaterEqual(histogram._highest_equivalent(index), ticks)
+            self.assertLessEqual(histogram._highest_equivalent(index) - ticks, ticks / 128)
+
+    def test_values_beyond_highest(self):
+        # counted in the last bucket; min and max stay exact
+        histogram = Histogram(highest=1.0)
+        histogram.record(5.0)
+        histogram.record(0.5)
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.max, 5.0)
+        self.assertAlmostEqual(histogram.percentile(100), 1.0, delta=1.0 / 128)
+
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(99), 0.0)
+        self.assertEqual(histogram.mean(), 0.0)
+
+    def test_merge(self):
+        rng = random.Random(1)
+        values = [rng.uniform(0, 2) for _ in range(1000)]
+        merged, whole = Histogram(), Histogram()
+        for part in (values[:300], values[300:]):
+            histogram = Histogram()
+            for value in part:
+                histogram.record(value)
+                whole.record(value)
+            merged.merge(histogram)
+        self.assertEqual(merged.counts, whole.counts)
+        self.assertEqual((merged.count, merged.min, merged.max), (whole.count, whole.min, whole.max))
+        self.assertAlmostEqual(merged.total, whole.total)
+
+    def test_merge_different_layouts(self):
+        with self.assertRaises(ValueError):
+            Histogram().merge(Histogram(sub_bucket_bits=7))
+
+    def test_dict_roundtrip(self):
+        stats = Stats()
+        for status_code, latency in ((200, 0.1), (200, 0.2), (0, 5.0), (500, 0.01)):
+            stats.record(status_code, latency)
+        copy = Stats.from_dict(stats.to_dict())
+        self.assertEqual(copy.count(), 4)
+        self.assertEqual(copy.count(200), 2)
+        self.assertEqual(copy.count(0), 1)
+        self.assertEqual(copy.latency.percentile(50), stats.latency.percentile(50))
+
+if __name__ == '__main__':
+    unittest.main()
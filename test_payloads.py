@@ -0,0 +1,60 @@
+# USAGE:
+# python3 -m unittest test_payloads
+import json
+import gzip
+import base64
+import unittest
+
+import payloads
+
+USER = {'user_id': 'u1', 'policy': '(A and B)', 'private_key': 'K', 'attributes': ['A', 'B']}
+
+class SpliceEncounterTest(unittest.TestCase):
+    def test_fields_added(self):
+        record = json.dumps({'image': 'abc', 'n': 1}).encode('utf-8')
+        self.assertEqual(json.loads(payloads.splice_encounter(record, USER).decode('utf-8')),
+                         {'image': 'abc', 'n': 1, 'policy': '(A and B)', 'user_id': 'u1'})
+
+    def test_stale_values_overridden(self):
+        record = b'{"policy": "old", "user_id": "old", "n": 1}\n'
+        encounter = json.loads(payloads.splice_encounter(record, USER).decode('utf-8'))
+        self.assertEqual((encounter['policy'], encounter['user_id']), ('(A and B)', 'u1'))
+
+    def test_empty_record(self):
+        self.assertEqual(json.loads(payloads.splice_encounter(b'{ }', USER).decode('utf-8')),
+                         {'policy': '(A and B)', 'user_id': 'u1'})
+
+class EncodeTest(unittest.TestCase):
+    document = json.dumps({'image': base64.b64encode(b'\x00\x01image').decode('ascii'), 'n': 1}).encode('utf-8')
+
+    def test_gzip(self):
+        body, headers = payloads.encode(self.document, 'gzip')
+        self.assertEqual(gzip.decompress(body), self.document)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+    def test_multipart(self):
+        body, headers = payloads.encode(self.document, 'multipart', 'b0')
+        self.assertEqual(headers['Content-Type'], 'multipart/form-data; boundary=b0')
+        self.assertIn(b'name="image"\r\nContent-Type: application/octet-stream\r\n\r\n\x00\x01image\r\n', body)
+        self.assertIn(b'\r\n\r\n{"n": 1}\r\n', body)
+        self.assertTrue(body.endswith(b'--b0--\r\n'))
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            payloads.encode(self.document, 'xml')
+
+class PrepareTest(unittest.TestCase):
+    def test_items_and_shared_bodies(self):
+        records = [{'n': 1}, {'n': 2}, {'n': 1}, {'skip': True}]
+        prepared_payloads = payloads.Payloads('json')
+        prepared = prepared_payloads.prepare(lambda: iter(records),
+                                             lambda record: None if 'skip' in record else prepared_payloads.json(record))
+        self.assertEqual(len(prepared), 3)
+        # identical bodies are stored once
+        self.assertEqual(prepared_payloads.bodies.size, 2 * len(b'{"n": 1}'))
+        for _ in range(2):
+            items = [(bytes(body), headers, meta) for (body, headers), meta in prepared]
+            self.assertEqual(items, [(json.dumps(record).encode('utf-8'), payloads.JSON_HEADERS, record) for record in records[:3]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# USAGE:
+# python3 -m unittest test_policies
+import re
+import json
+import unittest
+
+from policies import PolicyGenerator, SHAPES
+
+def satisfied(policy, attributes):
+    # evaluates a generated policy: attribute names, and/or gates and
+    # 'k of (...)' thresholds
+    tokens = re.findall(r'\(|\)|,|[A-Z]+|\d+|of|and|or', policy)
+    position = [0]
+
+    def expression():
+        values, gates = [term()], set()
+        while position[0] < len(tokens) and tokens[position[0]] in ('and', 'or'):
+            gates.add(tokens[position[0]])
+            position[0] += 1
+            values.append(term())
+        return all(values) if 'and' in gates else any(values)
+
+    def term():
+        token = tokens[position[0]]
+        position[0] += 1
+        if token == '(':
+            value = expression()
+            position[0] += 1
+            return value
+        if token.isdigit():
+            position[0] += 2
+            values = [expression()]
+            while tokens[position[0]] == ',':
+                position[0] += 1
+                values.append(expression())
+            position[0] += 1
+            return sum(values) >= int(token)
+        return token in attributes
+
+    return expression()
+
+class PolicyGeneratorTest(unittest.TestCase):
+    def test_sizes_and_satisfaction(self):
+        for shape in SHAPES:
+            for fraction in (0, 1):
+                generator = PolicyGenerator(8, 12, shape=shape, vocabulary=64, satisfying=fraction, seed=1, num_templates=4)
+                for _ in range(50):
+                    policy, attributes = generator.record()
+                    self.assertEqual(len(set(re.findall(r'[A-Z]+', policy))), 8)
+                    self.assertEqual(len(set(attributes)), 12)
+                    self.assertEqual(satisfied(policy, set(attributes)), fraction == 1, '{} {}'.format(shape, policy))
+
+    def test_seeded(self):
+        lines = [list(PolicyGenerator(8, 8, seed=3, num_templates=2).lines(20)) for _ in range(2)]
+        self.assertEqual(lines[0], lines[1])
+        for line in lines[0]:
+            record = json.loads(line)
+            self.assertEqual(sorted(record), ['attributes', 'policy'])
+
+    def test_vocabulary_too_small(self):
+        with self.assertRaises(ValueError):
+            PolicyGenerator(300, 8, vocabulary=256)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# USAGE:
+# python3 -m unittest test_retry
+import time
+import random
+import unittest
+
+from retry import RetryScheduler
+
+class RetrySchedulerTest(unittest.TestCase):
+    def scheduler(self, **settings):
+        return RetryScheduler(**dict(dict(budget=1.0, budget_min=0, base_delay=0.0, max_delay=0.0, max_attempts=5), **settings))
+
+    def test_backoff_bounds(self):
+        random.seed(0)
+        retries = self.scheduler(base_delay=0.1, max_delay=1.0)
+        for attempt in range(1, 10):
+            ceiling = min(1.0, 0.1 * 2 ** (attempt - 1))
+            delays = [retries.backoff(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= delay <= ceiling for delay in delays), 'attempt {}'.format(attempt))
+            # full jitter spreads the delays over the whole range
+            self.assertGreater(max(delays), ceiling * 0.9)
+            self.assertLess(min(delays), ceiling * 0.1)
+
+    def test_budget(self):
+        retries = self.scheduler(budget=0.2, budget_min=3)
+        for _ in range(10):
+            retries.attempted(0)
+        scheduled = [retries.schedule(item, 1) for item in range(10)]
+        # 0.2 * 10 first attempts + 3
+        self.assertEqual(scheduled, [True] * 5 + [False] * 5)
+        self.assertEqual((retries.retries, retries.dropped, len(retries)), (5, 5, 5))
+
+    def test_retries_do_not_count_as_first_attempts(self):
+        retries = self.scheduler(budget=1.0)
+        retries.attempted(0)
+        retries.attempted(1)
+        retries.attempted(2)
+        self.assertTrue(retries.schedule('a', 1))
+        self.assertFalse(retries.schedule('b', 1))
+
+    def test_max_attempts(self):
+        retries = self.scheduler(budget=100.0, max_attempts=3)
+        retries.attempted(0)
+        self.assertTrue(retries.schedule('a', 2))
+        self.assertFalse(retries.schedule('a', 3))
+        self.assertEqual(retries.dropped, 1)
+
+    def test_due_only_yields_due_retries(self):
+        retries = self.scheduler()
+        retries.attempted(0)
+        retries.attempted(0)
+        retries.backoff = lambda attempt: 60.0
+        retries.schedule('later', 1)
+        retries.backoff = lambda attempt: 0.0
+        retries.schedule('now', 1)
+        self.assertEqual(list(retries.due()), [('now', 1)])
+        self.assertEqual(len(retries), 1)
+
+    def test_interleave(self):
+        retries = self.scheduler(budget=10.0)
+        sent = []
+        for item, attempt in retries.interleave(iter('abc')):
+            retries.attempted(attempt)
+            sent.append((item, attempt))
+            if item == 'a' and attempt < 2:
+                retries.schedule(item, attempt + 1)
+        # retries without a delay go out before the next first attempt
+        self.assertEqual(sent, [('a', 0), ('a', 1), ('a', 2), ('b', 0), ('c', 0)])
+
+    def test_drain_picks_up_new_retries(self):
+        retries = self.scheduler(budget=10.0, base_delay=0.01, max_delay=0.01)
+        retries.attempted(0)
+        retries.schedule('a', 1)
+        start = time.time()
+        drained = []
+        for item, attempt in retries.drain():
+            drained.append((item, attempt))
+            if attempt < 3:
+                retries.schedule(item, attempt + 1)
+        self.assertEqual(drained, [('a', 1), ('a', 2), ('a', 3)])
+        self.assertLess(time.time() - start, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# USAGE:
+# python3 -m unittest test_servertiming
+import unittest
+
+import servertiming
+
+class ParseTest(unittest.TestCase):
+    def test_durations_in_seconds(self):
+        self.assertEqual(servertiming.parse(['db;dur=53.5, app;desc="render";dur=47']), {'db': 0.0535, 'app': 0.047})
+
+    def test_several_headers_and_repeated_metrics(self):
+        timings = servertiming.parse(['db;dur=10', 'db;dur=5, cache'])
+        self.assertAlmostEqual(timings['db'], 0.015)
+        self.assertEqual(timings['cache'], 0.0)
+
+    def test_malformed_metrics(self):
+        self.assertEqual(servertiming.parse(['abe;dur=x, ;dur=3, ,mediator;DUR="2"']), {'abe': 0.0, 'mediator': 0.002})
+
+    def test_header_values(self):
+        self.assertEqual(servertiming.header_values({'Server-Timing': 'db;dur=1'}), ['db;dur=1'])
+        self.assertEqual(servertiming.header_values({}), [])
+
+class RequestIdTest(unittest.TestCase):
+    def test_request_ids(self):
+        first = servertiming.begin({'Accept': 'application/json'})
+        number, timings = servertiming.last()
+        self.assertEqual(first[servertiming.REQUEST_ID_HEADER], '{}-{}'.format(servertiming.prefix, number))
+        self.assertEqual(first['Accept'], 'application/json')
+        self.assertIsNone(timings)
+        second = servertiming.begin()
+        self.assertNotEqual(first[servertiming.REQUEST_ID_HEADER], second[servertiming.REQUEST_ID_HEADER])
+        servertiming.finish({'Server-Timing': 'il;dur=20'})
+        self.assertEqual(servertiming.last(), (number + 1, {'il': 0.02}))
+
+if __name__ == '__main__':
+    unittest.main()
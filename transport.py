@@ -0,0 +1,142 @@
+# Instrumented HTTP/1.1 transport. With PHASE_TIMING=1 client.py sends through
+# it instead of requests, and loadgen.py attaches the equivalent aiohttp trace
+# hooks, so every transaction is split into phases timed with perf_counter:
+#   dns - name resolution (new connections only)
+#   connect - TCP handshake (new connections only; includes TLS under aiohttp)
+#   tls - TLS handshake (new https connections only)
+#   upload - sending the request line, headers and body
+#   ttfb - from the end of the upload to the response headers, which is where
+#          the IL does its ABE work
+#   download - reading the response body
+import ssl
+import json
+import time
+import base64
+import socket
+import threading
+import http.client
+import requests
+
+from urllib.parse import urlsplit
+
+from config import *
+from histogram import Histogram
+
+PHASES = ('dns', 'connect', 'tls', 'upload', 'ttfb', 'download')
+
+class PhaseStats(object):
+    def __init__(self):
+        self.phases = dict((phase, Histogram()) for phase in PHASES)
+        self.lock = threading.Lock()
+
+    def record(self, timings):
+        with self.lock:
+            for phase, value in timings.items():
+                self.phases[phase].record(value)
+
+# one per process: every client and engine of a run records into it
+phases = PhaseStats()
+
+def encode_json(document):
+    return json.dumps(document).encode('utf-8')
+
+class Response(object):
+    def __init__(self, status_code, headers, content, timings):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.timings = timings
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+class NotSent(ConnectionError):
+    # the connection failed before the whole request was written, so the
+    # server cannot have acted on it
+    pass
+
+class Transport(object):
+    # one keep-alive connection per upstream per thread; certificates are not
+    # verified, as with the requests sessions
+    def __init__(self, phase_stats=None):
+        self.phase_stats = phase_stats or phases
+        self.local = threading.local()
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+        self.headers = dict(headers)
+        self.headers['Authorization'] = 'Basic ' + base64.b64encode('{}:{}'.format(auth.username, auth.password).encode('utf-8')).decode('utf-8')
+
+    def connect(self, scheme, host, port, timings):
+        start = time.perf_counter()
+        family, socket_type, protocol, _, address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+        resolved = time.perf_counter()
+        sock = socket.socket(family, socket_type, protocol)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect(address)
+        connected = time.perf_counter()
+        timings['dns'] = resolved - start
+        timings['connect'] = connected - resolved
+        if scheme == 'https':
+            sock = self.context.wrap_socket(sock, server_hostname=host)
+            timings['tls'] = time.perf_counter() - connected
+        connection = http.client.HTTPConnection(host, port)
+        connection.sock = sock
+        return connection
+
+    def exchange(self, connection, method, path, body, request_headers, timings):
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=request_headers)
+        except ConnectionError as error:
+            raise NotSent(error)
+        sent = time.perf_counter()
+        response = connection.getresponse()
+        first_byte = time.perf_counter()
+        content = response.read()
+        timings['upload'] = sent - start
+        timings['ttfb'] = first_byte - sent
+        timings['download'] = time.perf_counter() - first_byte
+        return response, content
+
+    def request(self, method, url, data=None, json=None, headers=None, close=False):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        body = data if json is None else encode_json(json)
+        request_headers = dict(self.headers, **(headers or {}))
+        if close:
+            request_headers['Connection'] = 'close'
+        connections = self.local.__dict__.setdefault('connections', {})
+        connection = None if close else connections.pop(key, None)
+        timings = {}
+        try:
+            if connection is not None:
+                try:
+                    response, content = self.exchange(connection, method, path, body, request_headers, timings)
+                except (NotSent, http.client.CannotSendRequest):
+                    # the server closed the idle keep-alive connection before
+                    # the request was written; anything that fails once it
+                    # went out, a close without a byte of response included,
+                    # may have reached the server and is left to the caller's
+                    # retry policy, so a save is not sent twice
+                    connection.close()
+                    connection = None
+                    timings.clear()
+            if connection is None:
+                connection = self.connect(*key, timings=timings)
+                response, content = self.exchange(connection, method, path, body, request_headers, timings)
+        except (OSError, http.client.HTTPException) as error:
+            if connection is not None:
+                connection.close()
+            raise requests.ConnectionError(error)
+        if close or response.will_close:
+            connection.close()
+        else:
+            connections[key] = connection
+        self.phase_stats.record(timings)
+        return Response(response.status, response.headers, content, timings)